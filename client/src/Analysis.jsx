@@ -1,13 +1,13 @@
 import React, { useState, useRef, useEffect } from 'react';
 import Loader from './Components/Loader';
 import { useLocation, useNavigate } from 'react-router-dom';
-import axios from 'axios';
 import InstagramProfile from './Components/InstagramProfile';
 import { Link } from 'react-router-dom';
 // import { data } from './Components/data';
 import Chat from './Components/Chat';
 import { useTheme } from './context/ThemeContext';
 import { URL } from './constant/url';
+import { runScrapeJob } from './utils/jobs';
 
 
 const Analysis = () => {
@@ -57,11 +57,12 @@ const Analysis = () => {
       if (dataFetchedRef.current) return;
       setIsLoading(true);
       try {
-        const response = await axios.post(`${URL}/scrape-instagram`, {
+        // Scrapes run as background jobs, so no request stays open while the actors run
+        const result = await runScrapeJob(URL, {
           username: uname,
           results_limit: 25
         });
-        setData(response.data);
+        setData(result);
         dataFetchedRef.current = true;
       } catch (err) {
         setError(err);
@@ -1,10 +1,10 @@
 import React, { useState, useRef, useEffect } from 'react';
 import { ArrowRight, Rocket } from "lucide-react";
-import axios from 'axios';
 import { useTheme } from '../context/ThemeContext';
 import ReactMarkdown from 'react-markdown';
 import remarkGfm from 'remark-gfm';
 import { URL } from '../constant/url';
+import { postEventStream } from '../utils/sse';
 
 
 const LoadingMessage = () => (
@@ -54,6 +54,7 @@ const Chat = () => {
     const [messages, setMessages] = useState([]);
     const [inputText, setInputText] = useState('');
     const [isLoading, setIsLoading] = useState(false);
+    const [isStreaming, setIsStreaming] = useState(false);
     const messagesEndRef = useRef(null);
     const { theme } = useTheme();
 
@@ -79,22 +80,36 @@ const Chat = () => {
         setInputText('');
         setIsLoading(true);
 
+        const aiMessageId = Date.now();
+        const updateAiMessage = (update) => {
+            setMessages(prev => {
+                const exists = prev.some(message => message.id === aiMessageId);
+                const base = exists ? prev : [...prev, { id: aiMessageId, type: 'ai', content: '', avatar: "/logo.png" }];
+                return base.map(message => (
+                    message.id === aiMessageId ? { ...message, ...update(message) } : message
+                ));
+            });
+        };
+
         try {
-            const aiResponse = await axios.post(`${URL}/run-flow`, {
+            // Tokens are shown as the agent writes them; 'done' carries the final cleaned response
+            await postEventStream(`${URL}/run-flow`, {
                 message: inputText,
-                clear_context: true
+                clear_context: true,
+                stream: true
+            }, (event, data) => {
+                if (event === 'token') {
+                    setIsStreaming(true);
+                    updateAiMessage(message => ({ content: message.content + data.text }));
+                } else if (event === 'done') {
+                    updateAiMessage(() => ({
+                        content: data.message.text,
+                        timestamp: data.message.timestamp
+                    }));
+                } else if (event === 'error') {
+                    throw new Error(data.detail);
+                }
             });
-
-            const responseText = aiResponse.data.message.text;
-
-            const newAiMessage = {
-                type: 'ai',
-                content: responseText,
-                avatar: "/logo.png",
-                timestamp: aiResponse.data.message.timestamp
-            };
-
-            setMessages(prev => [...prev, newAiMessage]);
         } catch (error) {
             console.error('Chat error:', error);
             const errorMessage = {
@@ -102,9 +117,10 @@ const Chat = () => {
                 content: "Sorry, I encountered an error processing your request.",
                 avatar: "/logo.png"
             };
-            setMessages(prev => [...prev, errorMessage]);
+            setMessages(prev => [...prev.filter(message => message.id !== aiMessageId), errorMessage]);
         } finally {
             setIsLoading(false);
+            setIsStreaming(false);
         }
     };
 
@@ -149,7 +165,7 @@ const Chat = () => {
                                 </div>
                             </div>
                         ))}
-                        {isLoading && <LoadingMessage />}
+                        {isLoading && !isStreaming && <LoadingMessage />}
                         <div ref={messagesEndRef} />
                     </div>
                 ) : (
@@ -1,13 +1,13 @@
 import React, { useState, useRef, useEffect } from 'react';
 import { ArrowRight, Rocket, Copy } from "lucide-react";
 import { Link } from 'react-router-dom'
-import axios from 'axios';
 import { useTheme } from './context/ThemeContext';
 import ReactMarkdown from 'react-markdown';
 import remarkGfm from 'remark-gfm';
 import { Chart as ChartJS, CategoryScale, LinearScale, BarElement, Title, Tooltip, Legend, ArcElement, PointElement, LineElement, DoughnutController } from 'chart.js';
 import { Bar, Pie, Line, Doughnut } from 'react-chartjs-2';
 import { URL } from './constant/url';
+import { postEventStream } from './utils/sse';
 
 
 ChartJS.register(
@@ -60,23 +60,26 @@ const ChartComponent = ({ data, theme }) => {
     }
   };
 
+  // The server sends one colour per group, sized to however many groups the question produced
+  const primary = data.datasets[0];
+  const groupName = (data.group_by || 'Category').replace(/_/g, ' ');
+
   const pieData = {
     labels: data.labels,
     datasets: [{
-      data: data.datasets[0].data,
-      backgroundColor: [
-        'rgba(54, 162, 235, 0.8)',
-        'rgba(255, 99, 132, 0.8)',
-        'rgba(255, 206, 86, 0.8)',
-      ],
+      label: primary.label,
+      data: primary.data,
+      backgroundColor: primary.backgroundColor,
+      borderColor: primary.borderColor,
+      borderWidth: 1
     }]
   };
 
   const lineData = {
     labels: data.labels,
     datasets: [{
-      label: 'Trend Analysis',
-      data: data.datasets[0].data,
+      label: primary.label,
+      data: primary.data,
       borderColor: 'rgb(75, 192, 192)',
       tension: 0.1
     }]
@@ -85,17 +88,10 @@ const ChartComponent = ({ data, theme }) => {
   const doughnutData = {
     labels: data.labels,
     datasets: [{
-      data: data.datasets[0].data,
-      backgroundColor: [
-        'rgba(54, 162, 235, 0.8)',
-        'rgba(255, 99, 132, 0.8)',
-        'rgba(255, 206, 86, 0.8)',
-      ],
-      borderColor: [
-        'rgba(54, 162, 235, 1)',
-        'rgba(255, 99, 132, 1)',
-        'rgba(255, 206, 86, 1)',
-      ],
+      label: primary.label,
+      data: primary.data,
+      backgroundColor: primary.backgroundColor,
+      borderColor: primary.borderColor,
       borderWidth: 1
     }]
   };
@@ -120,7 +116,7 @@ const ChartComponent = ({ data, theme }) => {
                 ...baseOptions.plugins,
                 title: {
                   display: true,
-                  text: 'Engagement Distribution',
+                  text: `Engagement by ${groupName}`,
                   color: theme === 'dark' ? '#fff' : '#000',
                   padding: 10,
                   font: { size: 14, weight: 'bold' }
@@ -139,7 +135,7 @@ const ChartComponent = ({ data, theme }) => {
                 ...baseOptions.plugins,
                 title: {
                   display: true,
-                  text: 'Content Distribution',
+                  text: `${primary.label} by ${groupName}`,
                   color: theme === 'dark' ? '#fff' : '#000',
                   padding: 10,
                   font: { size: 14, weight: 'bold' }
@@ -158,7 +154,7 @@ const ChartComponent = ({ data, theme }) => {
                 ...baseOptions.plugins,
                 title: {
                   display: true,
-                  text: 'Trend Analysis',
+                  text: `${primary.label} Trend`,
                   color: theme === 'dark' ? '#fff' : '#000',
                   padding: 10,
                   font: { size: 14, weight: 'bold' }
@@ -177,7 +173,7 @@ const ChartComponent = ({ data, theme }) => {
                 ...baseOptions.plugins,
                 title: {
                   display: true,
-                  text: 'Content Share',
+                  text: `${groupName} Share`,
                   color: theme === 'dark' ? '#fff' : '#000',
                   padding: 10,
                   font: { size: 14, weight: 'bold' }
@@ -232,11 +228,17 @@ const MessageContent = ({ content, theme, chartData }) => {
   );
 };
 
+// Streams /analysis as Server-Sent Events and calls onEvent(event, data) per frame
+const streamAnalysis = (message, onEvent) => (
+  postEventStream(`${URL}/analysis`, { message, stream: true }, onEvent)
+);
+
 const Demo = () => {
   const [active, setActive] = useState(false);
   const [messages, setMessages] = useState([]);
   const [inputText, setInputText] = useState('');
   const [isLoading, setIsLoading] = useState(false);
+  const [isStreaming, setIsStreaming] = useState(false);
   const messagesEndRef = useRef(null);
   const { theme } = useTheme();
 
@@ -262,24 +264,33 @@ const Demo = () => {
     setInputText('');
     setIsLoading(true);
 
+    const aiMessageId = Date.now();
+    const updateAiMessage = (update) => {
+      setMessages(prev => prev.map(message => (
+        message.id === aiMessageId ? { ...message, ...update(message) } : message
+      )));
+    };
+
     try {
-      const aiResponse = await axios.post(`${URL}/analysis`, {
-        message: inputText,
+      await streamAnalysis(inputText, (event, data) => {
+        if (event === 'visualization') {
+          setMessages(prev => [...prev, {
+            id: aiMessageId,
+            type: 'ai',
+            content: '',
+            avatar: "/logo.png",
+            timestamp: new Date().toISOString(),
+            chartData: data
+          }]);
+        } else if (event === 'token') {
+          setIsStreaming(true);
+          updateAiMessage(message => ({ content: message.content + data.text }));
+        } else if (event === 'done') {
+          updateAiMessage(() => ({ content: data.analysis, chartData: data.visualization }));
+        } else if (event === 'error') {
+          throw new Error(data.detail);
+        }
       });
-
-      const responseText = aiResponse.data.analysis;
-
-      const chartData = aiResponse.data.visualization;
-
-      const newAiMessage = {
-        type: 'ai',
-        content: responseText,
-        avatar: "/logo.png",
-        timestamp: new Date().toISOString(),
-        chartData: chartData
-      };
-
-      setMessages(prev => [...prev, newAiMessage]);
     } catch (error) {
       console.error('Chat error:', error);
       const errorMessage = {
@@ -287,9 +298,10 @@ const Demo = () => {
         content: "Sorry, I encountered an error processing your request.",
         avatar: "https://website.cdn.speechify.com/2023_10_DALL-E-Logo.webp?quality=80&width=1920"
       };
-      setMessages(prev => [...prev, errorMessage]);
+      setMessages(prev => [...prev.filter(message => message.id !== aiMessageId), errorMessage]);
     } finally {
       setIsLoading(false);
+      setIsStreaming(false);
     }
   };
 
@@ -354,7 +366,7 @@ const Demo = () => {
                 </div>
               </div>
             ))}
-            {isLoading && <LoadingMessage />}
+            {isLoading && !isStreaming && <LoadingMessage />}
             <div ref={messagesEndRef} />
           </div>
         ) : (
@@ -0,0 +1,25 @@
+import axios from 'axios';
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Submits a scrape job and long-polls it until it finishes; resolves with the scrape result
+export const runScrapeJob = async (baseUrl, body) => {
+  let job;
+  while (!job) {
+    try {
+      job = (await axios.post(`${baseUrl}/scrape-jobs`, body)).data;
+    } catch (err) {
+      // The queue is full: wait as long as the server suggests, then try again
+      if (err.response?.status !== 429) throw err;
+      await sleep(Number(err.response.headers['retry-after'] || 5) * 1000);
+    }
+  }
+
+  while (job.status === 'queued' || job.status === 'running') {
+    job = (await axios.get(`${baseUrl}/scrape-jobs/${job.job_id}`, { params: { wait: 25 } })).data;
+  }
+  if (job.status !== 'succeeded') {
+    throw new Error(job.error || `Scrape ${job.status}`);
+  }
+  return job.result;
+};
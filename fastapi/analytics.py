@@ -0,0 +1,161 @@
+import colorsys
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+from dataset import social_dataset
+
+# Numeric fields of data.json kept as float64 columns
+NUMERIC_COLUMNS = (
+    "Likes", "Comments", "Shares", "User_Followers", "User_Following",
+    "User_Engagement", "User_Interactions"
+)
+ENGAGEMENT_COLUMNS = ("Likes", "Comments", "Shares")
+
+# Dimensions the /analysis chart can be grouped by, matched against the question text
+CHART_DIMENSIONS = {
+    "platform": "Platform",
+    "location": "Location",
+    "country": "Server_Post",
+    "language": "User_Language",
+    "privacy": "Privacy_Settings",
+    "verified": "Account_Verification",
+    "verification": "Account_Verification",
+    "username": "Username",
+    "media": "Media_Type",
+}
+DEFAULT_DIMENSION = "Media_Type"
+
+CHART_COLORS = (
+    (75, 192, 192), (255, 99, 132), (255, 206, 86), (54, 162, 235),
+    (153, 102, 255), (255, 159, 64), (201, 203, 207)
+)
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+class AnalyticsEngine:
+    """
+    Column-oriented, read-only view of the social dataset.
+
+    Numeric fields are stored as float64 arrays and string fields are
+    dictionary-encoded once, so group-bys reduce to np.bincount calls.
+    """
+
+    def __init__(self, records: Sequence[Dict]):
+        self.size = len(records)
+        self.numeric = {
+            col: np.array([_to_float(r.get(col)) for r in records], dtype=np.float64)
+            for col in NUMERIC_COLUMNS
+        }
+        self._raw = {
+            col: [r.get(col) for r in records]
+            for col in {key for r in records for key in r} - set(NUMERIC_COLUMNS)
+        }
+        self._encoded = {}
+
+    def categories(self, column: str):
+        """Return (labels, codes) for a string column, encoding it on first use"""
+        if column not in self._encoded:
+            if column not in self._raw:
+                raise KeyError(f"Unknown group-by column: {column}")
+            values = np.array(["" if v is None else str(v) for v in self._raw[column]])
+            labels, codes = np.unique(values, return_inverse=True)
+            self._encoded[column] = (labels.tolist(), codes)
+        return self._encoded[column]
+
+    def group_by(self, column: str, metrics: Sequence[str] = ENGAGEMENT_COLUMNS,
+                 agg: str = "mean") -> Dict[str, List]:
+        """
+        Aggregate numeric metrics per distinct value of column.
+
+        agg is one of "mean", "sum" or "count". Missing metric values are ignored.
+        """
+        labels, codes = self.categories(column)
+        n_groups = len(labels)
+        result = {
+            "labels": labels,
+            "count": np.bincount(codes, minlength=n_groups).tolist()
+        }
+        for metric in metrics:
+            values = self.numeric[metric]
+            present = ~np.isnan(values)
+            sums = np.bincount(codes, weights=np.where(present, values, 0.0), minlength=n_groups)
+            counts = np.bincount(codes, weights=present, minlength=n_groups)
+            if agg == "sum":
+                aggregated = sums
+            elif agg == "count":
+                aggregated = counts
+            elif agg == "mean":
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    aggregated = np.where(counts > 0, sums / np.maximum(counts, 1), 0.0)
+            else:
+                raise ValueError(f"Unsupported aggregation: {agg}")
+            result[metric] = aggregated.tolist()
+        return result
+
+    def engagement(self) -> np.ndarray:
+        """Per-record Likes + Comments + Shares"""
+        return np.nansum([self.numeric[col] for col in ENGAGEMENT_COLUMNS], axis=0)
+
+    def average_engagement_by(self, column: str) -> Dict[str, List]:
+        """Average total engagement per distinct value of column"""
+        labels, codes = self.categories(column)
+        n_groups = len(labels)
+        sums = np.bincount(codes, weights=self.engagement(), minlength=n_groups)
+        counts = np.bincount(codes, minlength=n_groups)
+        return {"labels": labels, "engagement": (sums / np.maximum(counts, 1)).tolist()}
+
+def pick_dimension(message: Optional[str]) -> str:
+    """Pick the group-by column mentioned in a question, defaulting to media type"""
+    text = (message or "").lower()
+    for keyword, column in CHART_DIMENSIONS.items():
+        if keyword in text:
+            return column
+    return DEFAULT_DIMENSION
+
+def _colors(n: int, alpha: float) -> List[str]:
+    # The fixed palette covers small groupings; larger ones (e.g. locations) get evenly spaced hues
+    if n <= len(CHART_COLORS):
+        rgb = CHART_COLORS[:n]
+    else:
+        rgb = [tuple(round(c * 255) for c in colorsys.hls_to_rgb(i / n, 0.55, 0.65)) for i in range(n)]
+    return [f"rgba({r}, {g}, {b}, {alpha})" for r, g, b in rgb]
+
+def build_visualization(engine: "AnalyticsEngine", message: Optional[str] = None) -> Dict:
+    """Build the Chart.js payload for /analysis from real aggregates"""
+    column = pick_dimension(message)
+    engagement = engine.average_engagement_by(column)
+    averages = engine.group_by(column)
+    labels = engagement["labels"]
+
+    datasets = [{
+        "label": 'Average Engagement',
+        "data": [round(v, 2) for v in engagement["engagement"]],
+        "backgroundColor": _colors(len(labels), 0.6),
+        "borderColor": _colors(len(labels), 1),
+        "borderWidth": 1
+    }]
+    for metric in ENGAGEMENT_COLUMNS:
+        datasets.append({
+            "label": f'Average {metric}',
+            "data": [round(v, 2) for v in averages[metric]],
+            "backgroundColor": _colors(len(labels), 0.6),
+            "borderColor": _colors(len(labels), 1),
+            "borderWidth": 1
+        })
+
+    return {
+        "labels": labels,
+        "group_by": column,
+        "counts": averages["count"],
+        "datasets": datasets
+    }
+
+# Rebuilt together with each new snapshot of data.json
+social_dataset.register_view("analytics", AnalyticsEngine)
+
+def get_engine() -> AnalyticsEngine:
+    """Return the engine for the current dataset snapshot"""
+    return social_dataset.view("analytics")
@@ -0,0 +1,338 @@
+"""
+Offline benchmark of the API against local stand-ins for its paid services.
+
+Starts the fakes from benchmarks/fakes.py and the real app (uvicorn main:app)
+in subprocesses, drives each scenario with a closed loop of concurrent
+clients at several concurrency levels, and reports latency percentiles and
+throughput. Results are written to benchmarks/results/ as JSON and can be
+compared with an earlier run:
+
+    cd fastapi
+    python -m benchmarks.bench --scenarios run-flow,analysis --concurrency 1,8,32
+    python -m benchmarks.bench --compare benchmarks/results/<earlier>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import secrets
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from benchmarks import fakes
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(APP_DIR, "benchmarks", "results")
+
+# App settings applied unless already set in the environment: the Gemini rate
+# limiter guards a real quota and would otherwise be all a benchmark measures
+APP_DEFAULTS = {
+    "GEMINI_REQUESTS_PER_MINUTE": "0",
+    "TRACING_ENABLED": "true",
+}
+
+@dataclass
+class Scenario:
+    method: str
+    path: str
+    body: Optional[Callable[[str], dict]] = None
+    stream: bool = False
+
+SCENARIOS: Dict[str, Scenario] = {
+    "health": Scenario("GET", "/health"),
+    "run-flow": Scenario("POST", "/run-flow", lambda key: {"message": f"How did my posts perform in {key}?"}),
+    "run-flow-stream": Scenario("POST", "/run-flow",
+                                lambda key: {"message": f"How did my posts perform in {key}?", "stream": True},
+                                stream=True),
+    "analysis": Scenario("POST", "/analysis", lambda key: {"message": f"Which post types drive engagement in {key}?"}),
+    "analysis-stream": Scenario("POST", "/analysis",
+                                lambda key: {"message": f"Which post types drive engagement in {key}?", "stream": True},
+                                stream=True),
+    "scrape": Scenario("POST", "/scrape-instagram", lambda key: {"username": f"bench_{key}", "results_limit": 5}),
+    "scrape-batch": Scenario("POST", "/scrape-instagram/batch",
+                             lambda key: {"usernames": [f"bench_{key}_{i}" for i in range(10)], "results_limit": 5}),
+}
+
+@dataclass
+class Sample:
+    latency: float
+    ttfb: float
+    ok: bool
+
+@dataclass
+class LevelResult:
+    scenario: str
+    concurrency: int
+    samples: List[Sample] = field(default_factory=list)
+    elapsed: float = 0.0
+    statuses: Dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> dict:
+        latencies = sorted(s.latency for s in self.samples if s.ok)
+        ttfbs = sorted(s.ttfb for s in self.samples if s.ok)
+        completed = len(self.samples)
+        errors = sum(1 for s in self.samples if not s.ok)
+        ms = lambda seconds: round(seconds * 1000, 1) if seconds is not None else None
+        return {
+            "scenario": self.scenario,
+            "concurrency": self.concurrency,
+            "requests": completed,
+            "errors": errors,
+            "error_rate": round(errors / completed, 4) if completed else 0.0,
+            "rps": round(len(latencies) / self.elapsed, 2) if self.elapsed else 0.0,
+            "p50_ms": ms(percentile(latencies, 50)),
+            "p95_ms": ms(percentile(latencies, 95)),
+            "p99_ms": ms(percentile(latencies, 99)),
+            "max_ms": ms(latencies[-1] if latencies else None),
+            "ttfb_p50_ms": ms(percentile(ttfbs, 50)),
+            "statuses": self.statuses,
+        }
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    rank = max(int(-(-pct * len(values) // 100)), 1)
+    return values[rank - 1]
+
+async def timed_request(session: aiohttp.ClientSession, base_url: str, scenario: Scenario,
+                        key: str) -> Tuple[Sample, str]:
+    """Issue one request and time it to the first and the last byte of the body"""
+    body = scenario.body(key) if scenario.body else None
+    start = time.perf_counter()
+    ttfb = None
+    failed_in_stream = False
+    try:
+        async with session.request(scenario.method, base_url + scenario.path, json=body) as response:
+            async for data in response.content.iter_any():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - start
+                # Streams report failures in-band, as an 'error' event
+                failed_in_stream = failed_in_stream or (scenario.stream and b"event: error" in data)
+            latency = time.perf_counter() - start
+            ok = response.status < 400 and not failed_in_stream
+            status = "stream_error" if failed_in_stream else str(response.status)
+            return Sample(latency, ttfb if ttfb is not None else latency, ok), status
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        return Sample(time.perf_counter() - start, 0.0, False), type(e).__name__
+
+async def run_level(base_url: str, name: str, scenario: Scenario, concurrency: int, duration: float,
+                    warmup: float, run_token: str, repeat: bool, timeout: float) -> LevelResult:
+    """Keep `concurrency` clients busy for warmup + duration seconds, recording only after the warmup"""
+    result = LevelResult(name, concurrency)
+    counter = iter(range(10 ** 9))
+    connector = aiohttp.TCPConnector(limit=0)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        started = time.perf_counter()
+        measure_from = started + warmup
+        stop_at = measure_from + duration
+
+        async def client():
+            while time.perf_counter() < stop_at:
+                # Unique inputs miss every cache unless --repeat asks for the cached path
+                key = f"{run_token}-0" if repeat else f"{run_token}-{next(counter)}"
+                issued = time.perf_counter()
+                sample, status = await timed_request(session, base_url, scenario, key)
+                if issued >= measure_from:
+                    result.samples.append(sample)
+                    result.statuses[status] = result.statuses.get(status, 0) + 1
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        # Requests still running at stop_at finish and count, so measure until the last one does
+        result.elapsed = max(time.perf_counter() - measure_from, 1e-9)
+    return result
+
+async def wait_until_up(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(url) as response:
+                    if response.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+            await asyncio.sleep(0.2)
+
+def start_process(args: List[str], env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    log = open(log_path, "w", encoding="utf-8")
+    return subprocess.Popen(args, cwd=APP_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+def stop_process(process: Optional[subprocess.Popen]) -> None:
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+def git_revision() -> Optional[str]:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+                                  capture_output=True, text=True, timeout=10).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=APP_DIR,
+                               capture_output=True, text=True, timeout=10).stdout.strip()
+        return f"{revision}-dirty" if revision and dirty else revision or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def print_table(results: List[dict], baseline: Optional[Dict[tuple, dict]] = None) -> None:
+    header = f"{'scenario':<16} {'conc':>4} {'reqs':>6} {'err%':>6} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'ttfb50':>9}"
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        fmt = lambda value: f"{value:.1f}" if value is not None else "-"
+        print(f"{row['scenario']:<16} {row['concurrency']:>4} {row['requests']:>6} "
+              f"{row['error_rate'] * 100:>5.1f}% {row['rps']:>8.2f} {fmt(row['p50_ms']):>9} "
+              f"{fmt(row['p95_ms']):>9} {fmt(row['p99_ms']):>9} {fmt(row['ttfb_p50_ms']):>9}")
+        previous = (baseline or {}).get((row["scenario"], row["concurrency"]))
+        if previous:
+            print(f"{'  vs baseline':<21} {'':>6} {'':>6} {change(previous['rps'], row['rps']):>8} "
+                  f"{change(previous['p50_ms'], row['p50_ms']):>9} {change(previous['p95_ms'], row['p95_ms']):>9} "
+                  f"{change(previous['p99_ms'], row['p99_ms']):>9} "
+                  f"{change(previous['ttfb_p50_ms'], row['ttfb_p50_ms']):>9}")
+
+def change(before: Optional[float], after: Optional[float]) -> str:
+    if not before or after is None:
+        return "-"
+    return f"{(after - before) / before * 100:+.0f}%"
+
+def load_baseline(path: str) -> Dict[tuple, dict]:
+    with open(path, "r", encoding="utf-8") as file:
+        report = json.load(file)
+    return {(row["scenario"], row["concurrency"]): row for row in report["results"]}
+
+def save_report(report: dict, label: Optional[str]) -> str:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    name = datetime.now().strftime("%Y%m%d-%H%M%S") + (f"-{label}" if label else "") + ".json"
+    path = os.path.join(RESULTS_DIR, name)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    return path
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the API against local stand-ins for its paid services")
+    parser.add_argument("--scenarios", default="health,run-flow,analysis,scrape",
+                        help=f"Comma-separated scenarios out of: {', '.join(SCENARIOS)} (default %(default)s)")
+    parser.add_argument("--concurrency", default="1,8,32",
+                        help="Comma-separated numbers of concurrent clients (default %(default)s)")
+    parser.add_argument("--duration", type=float, default=15,
+                        help="Measured seconds per scenario and concurrency level (default %(default)s)")
+    parser.add_argument("--warmup", type=float, default=3,
+                        help="Seconds of load before measuring starts (default %(default)s)")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--repeat", action="store_true",
+                        help="Send the same input every time, measuring the cached path")
+    parser.add_argument("--url", help="Benchmark an app that is already running (with its own upstreams) "
+                                      "instead of starting the app and the stand-ins")
+    parser.add_argument("--port", type=int, default=8900, help="Port the app is started on (default %(default)s)")
+    parser.add_argument("--base-port", type=int, default=9100, help="First port of the stand-ins (default %(default)s)")
+    parser.add_argument("--app-env", action="append", metavar="KEY=VALUE", default=[],
+                        help="Extra environment variable for the app, e.g. GEMINI_MAX_IN_FLIGHT=16")
+    parser.add_argument("--label", help="Name added to the results file")
+    parser.add_argument("--compare", metavar="RESULTS_JSON", help="Earlier results file to compare against")
+    parser.add_argument("--no-save", action="store_true", help="Don't write a results file")
+    fakes.add_behaviour_arguments(parser)
+    args = parser.parse_args(argv)
+
+    args.scenario_names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenario_names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    args.levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    for item in args.app_env:
+        if "=" not in item:
+            parser.error("--app-env expects KEY=VALUE")
+    # Validate the stand-in options here rather than in the subprocess
+    fakes.behaviours_from_args(args)
+    return args
+
+def fake_arguments(args: argparse.Namespace) -> List[str]:
+    forwarded = ["--base-port", str(args.base_port), "--jitter", str(args.jitter),
+                 "--answer-chars", str(args.answer_chars), "--stream-chunks", str(args.stream_chunks),
+                 "--apify-per-url", str(args.apify_per_url)]
+    for value in args.latency or []:
+        forwarded += ["--latency", value]
+    for value in args.errors or []:
+        forwarded += ["--errors", value]
+    return forwarded
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+    run_token = secrets.token_hex(3)
+    app_env = dict(item.split("=", 1) for item in args.app_env)
+    fake_process = app_process = None
+    base_url = args.url.rstrip("/") if args.url else f"http://127.0.0.1:{args.port}"
+    log_dir = os.path.join(RESULTS_DIR, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+
+    try:
+        if not args.url:
+            env = {**os.environ, "PYTHONUNBUFFERED": "1"}
+            fake_process = start_process([sys.executable, "-m", "benchmarks.fakes", *fake_arguments(args)],
+                                         env, os.path.join(log_dir, "fakes.log"))
+            for index in range(len(fakes.SERVICES)):
+                await wait_until_up(f"http://127.0.0.1:{args.base_port + index}/healthz", 30)
+
+            # The stand-in endpoints always win over a developer's real credentials
+            env = {**APP_DEFAULTS, **os.environ, **app_env, **fakes.app_env(base_port=args.base_port),
+                   "PYTHONUNBUFFERED": "1"}
+            app_process = start_process([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                                         "--port", str(args.port), "--log-level", "warning"],
+                                        env, os.path.join(log_dir, "app.log"))
+            await wait_until_up(f"{base_url}/health", 60)
+
+        results = []
+        for name in args.scenario_names:
+            for level in args.levels:
+                print(f"⏱️  {name} at concurrency {level} ...", flush=True)
+                result = await run_level(base_url, name, SCENARIOS[name], level, args.duration,
+                                         args.warmup, f"{run_token}-{name}-{level}", args.repeat, args.timeout)
+                results.append(result.summary())
+    finally:
+        stop_process(app_process)
+        stop_process(fake_process)
+
+    return {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "label": args.label,
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "target": args.url or "local app with stand-ins",
+        "settings": {
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "repeat": args.repeat,
+            "latency": {**fakes.DEFAULT_LATENCY, **fakes.parse_service_values(args.latency, "--latency")},
+            "errors": fakes.parse_service_values(args.errors, "--errors"),
+            "jitter": args.jitter,
+            "answer_chars": args.answer_chars,
+            "stream_chunks": args.stream_chunks,
+            "apify_per_url": args.apify_per_url,
+            "app_env": {**({} if args.url else APP_DEFAULTS), **app_env},
+        },
+        "results": results,
+    }
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline = load_baseline(args.compare) if args.compare else None
+    report = asyncio.run(run_benchmark(args))
+    print()
+    print_table(report["results"], baseline)
+    if not args.no_save:
+        print(f"\n💾 Results saved to {save_report(report, args.label)}")
+
+if __name__ == "__main__":
+    main()
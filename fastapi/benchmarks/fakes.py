@@ -0,0 +1,550 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+SERVICES = ("apify", "astra", "gemini", "langflow")
+
+# Default one-way latencies in seconds, roughly what the real services take
+DEFAULT_LATENCY = {"apify": 2.0, "astra": 0.03, "gemini": 0.8, "langflow": 1.0}
+
+# Fixed IDs the app is configured with when pointed at the fakes
+LANGFLOW_ID = "bench-langflow"
+FLOW_ID = "bench-flow"
+KEYSPACE = "default_keyspace"
+
+class Behaviour:
+    """Latency and failure injection for one fake service"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.2, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+
+    def delay(self) -> float:
+        # Uniform jitter around the configured latency, never negative
+        return max(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter), 0.0)
+
+    def fails(self) -> bool:
+        self.requests += 1
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return True
+        return False
+
+    async def wait(self, share: float = 1.0) -> None:
+        delay = self.delay() * share
+        if delay:
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {"latency": self.latency, "jitter": self.jitter, "error_rate": self.error_rate,
+                "requests": self.requests, "errors": self.errors}
+
+def unavailable(service: str) -> web.Response:
+    return web.json_response({"error": {"message": f"{service} stand-in: injected failure"}}, status=503)
+
+async def healthz(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok"})
+
+# ---------------------------------------------------------------- Apify
+
+def input_urls(run_input: dict) -> List[str]:
+    return run_input.get("directUrls") or ["https://www.instagram.com/bench/"]
+
+def username_from_url(url: str) -> str:
+    return url.rstrip("/").rsplit("/", 1)[-1]
+
+def fake_posts(username: str, count: int, newer_than: Optional[str] = None) -> List[dict]:
+    """Newest-first posts, stable per username so incremental scrapes find their stored posts"""
+    seed = random.Random(username)
+    base = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    posts = []
+    for index in range(count):
+        timestamp = (base - timedelta(hours=12 * index)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        if newer_than and timestamp <= newer_than:
+            break
+        kind = seed.choice(["Image", "Video", "Sidecar"])
+        posts.append({
+            "id": f"{username}-{index}",
+            "type": kind,
+            "url": f"https://www.instagram.com/p/{username}{index}/",
+            "caption": f"Post {index} by {username} #benchmark",
+            "likesCount": seed.randint(10, 5000),
+            "commentsCount": seed.randint(0, 300),
+            "timestamp": timestamp,
+            "videoViewCount": seed.randint(100, 50000) if kind == "Video" else 0,
+            "videoDuration": round(seed.uniform(5, 90), 2) if kind == "Video" else 0,
+            "ownerUsername": username
+        })
+    return posts
+
+def fake_profile(username: str) -> dict:
+    seed = random.Random(username)
+    return {
+        "username": username,
+        "fullName": username.replace("_", " ").title(),
+        "biography": "Benchmark profile",
+        "followersCount": seed.randint(100, 100000),
+        "followsCount": seed.randint(10, 1000),
+        "verified": False,
+        "profilePicUrl": "",
+        "externalUrl": "",
+        "businessCategoryName": "",
+        "postsCount": 200,
+        "latestPosts": fake_posts(username, 12)
+    }
+
+class FakeApify:
+    """
+    The slice of the Apify API the app's client uses: start an actor run,
+    long-poll it, abort it and list its dataset. A run takes the configured
+    latency (its start-up cost) plus per_url seconds for every URL after the
+    first; injected failures end the run as FAILED with an empty dataset,
+    which is how real runs fail (the Apify client retries 5xx itself).
+    """
+
+    def __init__(self, behaviour: Behaviour, per_url: float = 0.1):
+        self.behaviour = behaviour
+        self.per_url = per_url
+        self.runs: Dict[str, dict] = {}
+
+    def run_data(self, run: dict) -> dict:
+        if run["status"] == "RUNNING" and time.monotonic() >= run["finishes_at"]:
+            run["status"] = "FAILED" if run["failed"] else "SUCCEEDED"
+        return {"id": run["id"], "status": run["status"], "defaultDatasetId": run["id"]}
+
+    async def start(self, request: web.Request) -> web.Response:
+        run_input = await request.json()
+        run_id = uuid.uuid4().hex
+        self.runs[run_id] = {
+            "id": run_id,
+            "status": "RUNNING",
+            "input": run_input,
+            "failed": self.behaviour.fails(),
+            "finishes_at": time.monotonic() + self.behaviour.delay() + self.per_url * (len(input_urls(run_input)) - 1)
+        }
+        return web.json_response({"data": self.run_data(self.runs[run_id])}, status=201)
+
+    async def get_run(self, request: web.Request) -> web.Response:
+        run = self.runs.get(request.match_info["run_id"])
+        if run is None:
+            return web.json_response({"error": {"message": "Run not found"}}, status=404)
+        wait_for = float(request.query.get("waitForFinish", 0))
+        remaining = run["finishes_at"] - time.monotonic()
+        if run["status"] == "RUNNING" and remaining > 0 and wait_for > 0:
+            await asyncio.sleep(min(wait_for, remaining))
+        return web.json_response({"data": self.run_data(run)})
+
+    async def abort(self, request: web.Request) -> web.Response:
+        run = self.runs.get(request.match_info["run_id"])
+        if run is None:
+            return web.json_response({"error": {"message": "Run not found"}}, status=404)
+        if run["status"] == "RUNNING":
+            run["status"] = "ABORTED"
+        return web.json_response({"data": self.run_data(run)})
+
+    async def items(self, request: web.Request) -> web.Response:
+        run = self.runs.get(request.match_info["run_id"])
+        if run is None:
+            return web.json_response({"error": {"message": "Dataset not found"}}, status=404)
+        run_input = run["input"]
+        items = []
+        if run["status"] == "SUCCEEDED":
+            # Every item names the URL it came from, as the real actor does
+            for url in input_urls(run_input):
+                username = username_from_url(url)
+                if run_input.get("resultsType") == "details":
+                    url_items = [fake_profile(username)]
+                else:
+                    limit = int(run_input.get("resultsLimit") or run_input.get("maxItems") or 12)
+                    url_items = fake_posts(username, limit, run_input.get("onlyPostsNewerThan"))
+                items += [{**item, "inputUrl": url} for item in url_items]
+        return web.json_response(items, headers={
+            "x-apify-pagination-offset": "0",
+            "x-apify-pagination-limit": str(max(len(items), 1)),
+            "x-apify-pagination-count": str(len(items)),
+            "x-apify-pagination-total": str(len(items)),
+            "x-apify-pagination-desc": "false"
+        })
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/healthz", healthz)
+        app.router.add_post("/v2/acts/{actor}/runs", self.start)
+        app.router.add_get("/v2/actor-runs/{run_id}", self.get_run)
+        app.router.add_post("/v2/actor-runs/{run_id}/abort", self.abort)
+        app.router.add_get("/v2/datasets/{run_id}/items", self.items)
+        return app
+
+# ---------------------------------------------------------------- Astra DB
+
+def field_value(document: dict, path: str):
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+def matches(document: dict, query: dict) -> bool:
+    # Equality on (dotted) fields plus $and / $or, which is all the app's filters use
+    for key, expected in query.items():
+        if key == "$or":
+            if not any(matches(document, sub) for sub in expected):
+                return False
+        elif key == "$and":
+            if not all(matches(document, sub) for sub in expected):
+                return False
+        elif field_value(document, key) != expected:
+            return False
+    return True
+
+class FakeAstra:
+    """
+    In-memory Data API (JSON commands over HTTP) covering the collection
+    commands the app issues. Every command waits the configured latency;
+    injected failures answer 503.
+    """
+
+    def __init__(self, behaviour: Behaviour):
+        self.behaviour = behaviour
+        self.collections: Dict[str, Dict[str, dict]] = {"instagram_data": {}}
+
+    def find(self, name: str, query: dict) -> List[dict]:
+        return [doc for doc in self.collections.setdefault(name, {}).values() if matches(doc, query or {})]
+
+    async def keyspace_command(self, request: web.Request) -> web.Response:
+        await self.behaviour.wait()
+        if self.behaviour.fails():
+            return unavailable("astra")
+        command = await request.json()
+        if "findCollections" in command:
+            return web.json_response({"status": {"collections": list(self.collections)}})
+        if "createCollection" in command:
+            self.collections.setdefault(command["createCollection"]["name"], {})
+            return web.json_response({"status": {"ok": 1}})
+        return self.unsupported(command)
+
+    async def collection_command(self, request: web.Request) -> web.Response:
+        await self.behaviour.wait()
+        if self.behaviour.fails():
+            return unavailable("astra")
+        name = request.match_info["collection"]
+        command = await request.json()
+        (verb, body), = command.items()
+        body = body or {}
+        store = self.collections.setdefault(name, {})
+        found = self.find(name, body.get("filter"))
+
+        if verb == "findOne":
+            return web.json_response({"data": {"document": found[0] if found else None}})
+        if verb == "find":
+            limit = (body.get("options") or {}).get("limit")
+            return web.json_response({"data": {"documents": found[:limit] if limit else found, "nextPageState": None}})
+        if verb == "countDocuments":
+            return web.json_response({"status": {"count": len(found)}})
+        if verb == "findOneAndReplace":
+            options = body.get("options") or {}
+            status = {"matchedCount": len(found[:1]), "modifiedCount": len(found[:1])}
+            previous = found[0] if found else None
+            replacement = dict(body["replacement"])
+            if previous is not None:
+                replacement["_id"] = previous["_id"]
+            elif options.get("upsert"):
+                replacement.setdefault("_id", uuid.uuid4().hex)
+                status["upsertedId"] = replacement["_id"]
+            else:
+                return web.json_response({"data": {"document": None}, "status": status})
+            store[replacement["_id"]] = replacement
+            returned = replacement if options.get("returnDocument") == "after" else previous
+            return web.json_response({"data": {"document": returned}, "status": status})
+        if verb in ("insertOne", "insertMany"):
+            documents = [body["document"]] if verb == "insertOne" else body["documents"]
+            ids = []
+            for document in documents:
+                document = {"_id": uuid.uuid4().hex, **document}
+                store[document["_id"]] = document
+                ids.append(document["_id"])
+            return web.json_response({"status": {"insertedIds": ids}})
+        if verb in ("deleteOne", "deleteMany"):
+            doomed = found[:1] if verb == "deleteOne" else found
+            for document in doomed:
+                store.pop(document["_id"], None)
+            return web.json_response({"status": {"deletedCount": len(doomed)}})
+        return self.unsupported(command)
+
+    @staticmethod
+    def unsupported(command: dict) -> web.Response:
+        return web.json_response({"errors": [{
+            "message": f"Command not supported by the stand-in: {next(iter(command), '')}",
+            "errorCode": "UNSUPPORTED"
+        }]})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/healthz", healthz)
+        app.router.add_post("/api/json/v1/{keyspace}", self.keyspace_command)
+        app.router.add_post("/api/json/v1/{keyspace}/{collection}", self.collection_command)
+        # astrapy leaves out the /api/json prefix for non-Astra environments
+        app.router.add_post("/v1/{keyspace}", self.keyspace_command)
+        app.router.add_post("/v1/{keyspace}/{collection}", self.collection_command)
+        return app
+
+# ---------------------------------------------------------------- Gemini
+
+def fake_answer(prompt: str, length: int) -> str:
+    seed = random.Random(prompt)
+    sentences = [
+        "Video posts earn {n}% more comments than images.",
+        "Engagement peaks on posts published between {n}:00 and {m}:00.",
+        "Carousel posts reach {n}% more accounts on average.",
+        "Posts with questions in the caption get {n} more replies.",
+    ]
+    text = ""
+    while len(text) < length:
+        text += seed.choice(sentences).format(n=seed.randint(2, 60), m=seed.randint(12, 23)) + " "
+    return text[:length].strip()
+
+def candidate(text: str) -> dict:
+    return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"},
+                            "finishReason": "STOP", "index": 0}]}
+
+class FakeGemini:
+    """
+    generateContent and streamGenerateContent of the Gemini REST API. Plain
+    calls answer after the configured latency; streamed calls spread it over
+    stream_chunks pieces of the answer, sent as one incrementally written
+    JSON array like the real API.
+    """
+
+    def __init__(self, behaviour: Behaviour, answer_chars: int = 600, stream_chunks: int = 8):
+        self.behaviour = behaviour
+        self.answer_chars = answer_chars
+        self.stream_chunks = max(stream_chunks, 1)
+
+    @staticmethod
+    async def prompt_of(request: web.Request) -> str:
+        body = await request.json()
+        return "".join(part.get("text", "")
+                       for content in body.get("contents", [])
+                       for part in content.get("parts", []))
+
+    async def generate(self, request: web.Request) -> web.Response:
+        model, _, method = request.match_info["target"].partition(":")
+        prompt = await self.prompt_of(request)
+        if self.behaviour.fails():
+            await self.behaviour.wait(share=0.1)
+            return unavailable("gemini")
+        answer = fake_answer(prompt, self.answer_chars)
+
+        if method == "generateContent":
+            await self.behaviour.wait()
+            return web.json_response(candidate(answer))
+        if method != "streamGenerateContent":
+            return web.json_response({"error": {"message": f"Unknown method {method}"}}, status=404)
+
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        size = -(-len(answer) // self.stream_chunks)
+        pieces = [answer[i:i + size] for i in range(0, len(answer), size)] or [""]
+        await response.write(b"[")
+        for index, piece in enumerate(pieces):
+            await self.behaviour.wait(share=1 / len(pieces))
+            separator = b"," if index else b""
+            await response.write(separator + json.dumps(candidate(piece)).encode())
+        await response.write(b"]")
+        await response.write_eof()
+        return response
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/healthz", healthz)
+        app.router.add_post("/{version}/models/{target}", self.generate)
+        return app
+
+# ---------------------------------------------------------------- Langflow
+
+def flow_message(text: str, steps: List[dict]) -> dict:
+    return {
+        "text": text,
+        "sender": "Machine",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "session_id": uuid.uuid4().hex,
+        "content_blocks": [{"title": "Agent Steps", "contents": steps}]
+    }
+
+def flow_result(message: dict) -> dict:
+    return {"outputs": [{"inputs": {}, "outputs": [{"results": {"message": message}}]}]}
+
+class FakeLangflow:
+    """
+    Langflow's run endpoint, answering with plain JSON or, with ?stream=true,
+    newline-delimited add_message / token / end events. Injected failures
+    answer 503.
+    """
+
+    def __init__(self, behaviour: Behaviour, answer_chars: int = 400, stream_chunks: int = 8):
+        self.behaviour = behaviour
+        self.answer_chars = answer_chars
+        self.stream_chunks = max(stream_chunks, 1)
+
+    async def run(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        if self.behaviour.fails():
+            await self.behaviour.wait(share=0.1)
+            return unavailable("langflow")
+        question = payload.get("input_value", "")
+        answer = fake_answer(question, self.answer_chars)
+        steps = [{"type": "text", "header": {"title": "Input"}, "text": question},
+                 {"type": "tool_use", "name": "search_posts", "tool_input": {"query": question}, "output": "ok"}]
+
+        if request.query.get("stream") != "true":
+            await self.behaviour.wait()
+            return web.json_response(flow_result(flow_message(answer, steps)))
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(event: str, data: dict):
+            await response.write(json.dumps({"event": event, "data": data}).encode() + b"\n\n")
+
+        await send("add_message", flow_message("", steps[:1]))
+        size = -(-len(answer) // self.stream_chunks)
+        for start in range(0, len(answer), size):
+            await self.behaviour.wait(share=1 / self.stream_chunks)
+            await send("token", {"chunk": answer[start:start + size]})
+        message = flow_message(answer, steps)
+        await send("add_message", message)
+        await send("end", {"result": flow_result(message)})
+        await response.write_eof()
+        return response
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/healthz", healthz)
+        app.router.add_post("/lf/{langflow_id}/api/v1/run/{endpoint}", self.run)
+        return app
+
+# ---------------------------------------------------------------- Wiring
+
+class FakeServices:
+    """All four stand-ins, each listening on its own port from base_port up"""
+
+    def __init__(self, behaviours: Dict[str, Behaviour], host: str = "127.0.0.1", base_port: int = 9100,
+                 answer_chars: int = 600, stream_chunks: int = 8, apify_per_url: float = 0.1):
+        self.host = host
+        self.ports = {service: base_port + index for index, service in enumerate(SERVICES)}
+        self.fakes = {
+            "apify": FakeApify(behaviours["apify"], apify_per_url),
+            "astra": FakeAstra(behaviours["astra"]),
+            "gemini": FakeGemini(behaviours["gemini"], answer_chars, stream_chunks),
+            "langflow": FakeLangflow(behaviours["langflow"], answer_chars, stream_chunks),
+        }
+        self._runners: List[web.AppRunner] = []
+
+    def url(self, service: str) -> str:
+        return f"http://{self.host}:{self.ports[service]}"
+
+    async def start(self) -> None:
+        for service, fake in self.fakes.items():
+            runner = web.AppRunner(fake.app(), access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, self.host, self.ports[service]).start()
+            self._runners.append(runner)
+
+    async def stop(self) -> None:
+        for runner in self._runners:
+            await runner.cleanup()
+        self._runners.clear()
+
+def app_env(host: str = "127.0.0.1", base_port: int = 9100) -> Dict[str, str]:
+    """Environment variables pointing the app at stand-ins started with the same host and base_port"""
+    ports = {service: base_port + index for index, service in enumerate(SERVICES)}
+    url = lambda service: f"http://{host}:{ports[service]}"
+    return {
+        "APIFY_API_URL": url("apify"),
+        "APIFY_API_TOKEN": "bench-token",
+        "ASTRAPY_API_ENDPOINT": url("astra"),
+        "ASTRAPY_API_TOKEN": "bench-token",
+        "ASTRA_ENVIRONMENT": "other",
+        "ASTRAPY_KEYSPACE": KEYSPACE,
+        "GEMINI_API_ENDPOINT": url("gemini"),
+        "GEMINI_API_KEY": "bench-key",
+        "BASE_API_URL": url("langflow"),
+        "LANGFLOW_ID": LANGFLOW_ID,
+        "FLOW_ID": FLOW_ID,
+        "APPLICATION_TOKEN": "bench-token",
+    }
+
+def parse_service_values(values: List[str], option: str) -> Dict[str, float]:
+    """Parse repeated service=value options, e.g. --latency gemini=0.5"""
+    parsed = {}
+    for value in values or []:
+        service, _, number = value.partition("=")
+        if service not in SERVICES or not number:
+            raise argparse.ArgumentTypeError(f"{option} expects service=value with service in {', '.join(SERVICES)}")
+        parsed[service] = float(number)
+    return parsed
+
+def add_behaviour_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", action="append", metavar="SERVICE=SECS",
+                        help="Latency of a stand-in (defaults: " +
+                             ", ".join(f"{s}={v}" for s, v in DEFAULT_LATENCY.items()) + ")")
+    parser.add_argument("--errors", action="append", metavar="SERVICE=RATE",
+                        help="Share of calls to a stand-in that fail, 0 to 1 (default 0)")
+    parser.add_argument("--jitter", type=float, default=0.2,
+                        help="Latency varies uniformly by this fraction either way (default 0.2)")
+    parser.add_argument("--answer-chars", type=int, default=600,
+                        help="Length of Gemini and Langflow answers (default 600)")
+    parser.add_argument("--stream-chunks", type=int, default=8,
+                        help="Pieces streamed answers are split into (default 8)")
+    parser.add_argument("--apify-per-url", type=float, default=0.1,
+                        help="Seconds an actor run takes per extra profile URL (default 0.1)")
+
+def behaviours_from_args(args: argparse.Namespace) -> Dict[str, Behaviour]:
+    latency = {**DEFAULT_LATENCY, **parse_service_values(args.latency, "--latency")}
+    errors = parse_service_values(args.errors, "--errors")
+    return {service: Behaviour(latency[service], args.jitter, errors.get(service, 0.0)) for service in SERVICES}
+
+async def serve_forever(services: FakeServices) -> None:
+    await services.start()
+    for service in SERVICES:
+        print(f"🧪 Fake {service} listening on {services.url(service)}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await services.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run local stand-ins for Apify, Astra DB, Gemini and Langflow")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=9100,
+                        help="Port of the first stand-in; the others take the following ports (default 9100)")
+    add_behaviour_arguments(parser)
+    parser.add_argument("--print-env", action="store_true",
+                        help="Print the environment variables that point the app at the stand-ins and exit")
+    args = parser.parse_args()
+
+    if args.print_env:
+        for key, value in app_env(args.host, args.base_port).items():
+            print(f"{key}={value}")
+        return
+
+    services = FakeServices(behaviours_from_args(args), args.host, args.base_port,
+                            args.answer_chars, args.stream_chunks, args.apify_per_url)
+    try:
+        asyncio.run(serve_forever(services))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
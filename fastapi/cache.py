@@ -0,0 +1,95 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+HIT = "hit"
+STALE = "stale"
+MISS = "miss"
+
+class TTLCache:
+    """
+    Bounded in-memory cache with a per-entry TTL and LRU eviction.
+
+    Entries older than their TTL are still kept for `stale_ttl` seconds so
+    callers can serve them while a refresh runs (stale-while-revalidate).
+    """
+
+    def __init__(self, maxsize: int = 100, ttl: float = 3600, stale_ttl: float = 0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_with_status(self, key: Hashable) -> Tuple[Any, str]:
+        """Return (value, status) where status is 'hit', 'stale' or 'miss'"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, MISS
+
+            value, stored_at, ttl = entry
+            age = now - stored_at
+            if age < ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value, HIT
+            if age < ttl + self.stale_ttl:
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                return value, STALE
+
+            del self._entries[key]
+            self.misses += 1
+            return None, MISS
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a fresh value for key, or default"""
+        value, status = self.get_with_status(key)
+        return value if status == HIT else default
+
+    def peek(self, key: Hashable) -> Any:
+        """Return a fresh value for key, or None, without counting a lookup or refreshing its LRU position"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at, ttl = entry
+            return value if time.monotonic() - stored_at < ttl else None
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store value under key, evicting the least recently used entry if full"""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic(), self.ttl if ttl is None else ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Return size and hit/miss counters"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0
+        }
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data.json")
+
+# Minimum seconds between stat() calls on the data file
+DATASET_CHECK_INTERVAL = float(os.getenv("DATASET_CHECK_INTERVAL", 2))
+
+class DatasetSnapshot(NamedTuple):
+    """One parsed version of the dataset; never mutated after it is published"""
+    records: Tuple[Dict, ...]
+    views: MappingProxyType
+    mtime: float
+    digest: str
+    version: int
+
+class DatasetStore:
+    """
+    Process-level store for a JSON dataset file.
+
+    The file is parsed once and published as an immutable snapshot together
+    with any registered views (pre-chunked records, analytics columns, ...).
+    A new snapshot is built only when the file's mtime changes and its
+    content hash differs, then swapped in as a single reference assignment.
+    """
+
+    def __init__(self, path: str, check_interval: float = DATASET_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._builders: Dict[str, Callable[[Tuple[Dict, ...]], Any]] = {}
+        self._snapshot: Optional[DatasetSnapshot] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def register_view(self, name: str, builder: Callable[[Tuple[Dict, ...]], Any]) -> None:
+        """Register a derived view, built eagerly for every snapshot"""
+        with self._lock:
+            self._builders[name] = builder
+            if self._snapshot is not None:
+                self._snapshot = self._build(self._snapshot.records, self._snapshot.mtime,
+                                             self._snapshot.digest, self._snapshot.version)
+
+    def snapshot(self) -> DatasetSnapshot:
+        """Return the current snapshot, reloading first if the file changed"""
+        current = self._snapshot
+        now = time.monotonic()
+        if current is not None and now - self._last_check < self.check_interval:
+            return current
+
+        with self._lock:
+            self._last_check = now
+            current = self._snapshot
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if current is not None and mtime == current.mtime:
+                    return current
+
+                with open(self.path, "rb") as file:
+                    raw = file.read()
+                digest = hashlib.sha256(raw).hexdigest()
+                if current is not None and digest == current.digest:
+                    self._snapshot = current._replace(mtime=mtime)
+                    return self._snapshot
+
+                records = tuple(json.loads(raw))
+            except (OSError, ValueError) as e:
+                if current is None:
+                    raise
+                # The file may be mid-replace or half-written; keep serving what we have
+                print(f"❌ Error reloading {os.path.basename(self.path)}, keeping version {current.version}: {str(e)}")
+                return current
+
+            version = current.version + 1 if current is not None else 1
+            self._snapshot = self._build(records, mtime, digest, version)
+            print(f"📦 Loaded {len(records)} records from {os.path.basename(self.path)} (version {version})")
+            return self._snapshot
+
+    def view(self, name: str) -> Any:
+        """Return a registered view of the current snapshot"""
+        return self.snapshot().views[name]
+
+    def records(self) -> Tuple[Dict, ...]:
+        return self.snapshot().records
+
+    def _build(self, records, mtime, digest, version) -> DatasetSnapshot:
+        views = {name: builder(records) for name, builder in self._builders.items()}
+        return DatasetSnapshot(records, MappingProxyType(views), mtime, digest, version)
+
+# The social media dataset behind /analysis
+social_dataset = DatasetStore(DATA_PATH)
@@ -1,30 +1,224 @@
-import json
+import io
+import csv
+import math
+import time
 import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager, aclosing
 import google.generativeai as genai
-from typing import List, Dict
+from typing import List, Dict, AsyncIterator, Tuple, Optional
 from concurrent.futures import ThreadPoolExecutor
 import os
 from dotenv import load_dotenv
+from dataset import social_dataset
+from llmCache import PromptCache, ComputationCancelled
+from retrieval import BM25Index
+from resilience import Upstream
+from metrics import track_stage
+from tracing import span, traced, annotate
 
 load_dotenv()
 
 # Init Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel('gemini-pro')
+MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-pro")
+# GEMINI_API_ENDPOINT switches to the REST transport against another host, e.g. a local stand-in
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+if GEMINI_API_ENDPOINT:
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"), transport="rest",
+                    client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+else:
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+model = genai.GenerativeModel(MODEL_NAME)
+
+# Cache of Gemini answers keyed by a hash of model and prompt (disk tier only if LLM_CACHE_DIR is set)
+prompt_cache = PromptCache(
+    maxsize=int(os.getenv("LLM_CACHE_SIZE", 256)),
+    ttl=int(os.getenv("LLM_CACHE_TTL", 86400)),
+    disk_dir=os.getenv("LLM_CACHE_DIR") or None,
+    max_disk_bytes=int(os.getenv("LLM_CACHE_DISK_MAX_MB", 100)) * 1024 * 1024
+)
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks the calling worker until a token is free"""
+
+    def __init__(self, rate_per_sec: float, capacity: float):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# One worker pool per app lifespan, shared by every request
+GEMINI_MAX_WORKERS = int(os.getenv("GEMINI_MAX_WORKERS", 16))
+# Upper bound on Gemini calls in progress at once across all requests
+GEMINI_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", 8))
+# Requests per minute allowed upstream (0 disables), with bursts up to GEMINI_BURST
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", 60))
+GEMINI_BURST = float(os.getenv("GEMINI_BURST", 10))
+
+# Created on first use rather than at import, so a later lifespan in the same process gets a fresh one
+gemini_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+gemini_slots = threading.BoundedSemaphore(GEMINI_MAX_IN_FLIGHT)
+gemini_rate_limiter = TokenBucket(GEMINI_REQUESTS_PER_MINUTE / 60, GEMINI_BURST)
+# Retry/backoff, optional hedging and circuit breaking for Gemini calls (GEMINI_RETRY_* etc.)
+gemini_upstream = Upstream.from_env("gemini", "GEMINI", attempts=3)
+
+class GeminiCancelled(ComputationCancelled):
+    """The request that needed this Gemini call was cancelled or disconnected"""
+
+# Cancellation flag of the request a piece of work belongs to; worker threads see it
+# because run_on_pool copies the caller's context into the thread
+request_cancelled: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar(
+    "request_cancelled", default=None
+)
+
+def raise_if_cancelled():
+    event = request_cancelled.get()
+    if event is not None and event.is_set():
+        raise GeminiCancelled("Request was cancelled")
+
+@contextmanager
+def cancellation_scope():
+    # Flags Gemini work started inside the block as cancelled if the block is torn down
+    event = threading.Event()
+    token = request_cancelled.set(event)
+    try:
+        yield event
+    except BaseException:
+        event.set()
+        raise
+    finally:
+        try:
+            request_cancelled.reset(token)
+        except ValueError:
+            # Async generators may be closed from another context
+            pass
+
+def run_on_pool(fn, *args) -> asyncio.Future:
+    # Runs fn on the shared pool with the caller's context, including its cancellation flag
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(get_gemini_executor(), contextvars.copy_context().run, fn, *args)
+
+def get_gemini_executor() -> ThreadPoolExecutor:
+    # Returns the shared worker pool, creating it if none is running
+    global gemini_executor
+    with _executor_lock:
+        if gemini_executor is None:
+            gemini_executor = ThreadPoolExecutor(max_workers=GEMINI_MAX_WORKERS, thread_name_prefix="gemini")
+        return gemini_executor
+
+def call_gemini(prompt: str):
+    # Every attempt goes through the rate limiter and the in-flight cap, and is
+    # skipped if its request was cancelled while it waited for either; transient
+    # failures are retried and an open circuit fails fast
+    def attempt():
+        raise_if_cancelled()
+        gemini_rate_limiter.acquire()
+        with gemini_slots:
+            raise_if_cancelled()
+            with span("gemini_call", prompt_chars=len(prompt)), track_stage("gemini_call"):
+                return model.generate_content(prompt)
+
+    return gemini_upstream.call_sync(attempt, cancel_event=request_cancelled.get())
+
+def shutdown():
+    # Stops the shared worker pool when the app shuts down; the next call starts a new one
+    global gemini_executor
+    with _executor_lock:
+        executor, gemini_executor = gemini_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
 
 def load_json_data() -> List[Dict]:
-    # Loads social media data from JSON file
-    with open("data.json", "r") as file:
-        return json.load(file)
+    # Returns the social media records from the process-wide dataset store
+    return list(social_dataset.records())
+
+# Approximate prompt tokens of data per chunk; fewer, denser chunks mean fewer Gemini calls
+CHUNK_TOKEN_BUDGET = int(os.getenv("GEMINI_CHUNK_TOKEN_BUDGET", 3000))
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    # Rough token count without a tokenizer round-trip
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def record_columns(records: List[Dict]) -> List[str]:
+    # Union of keys in order of first appearance
+    return list(dict.fromkeys(key for record in records for key in record))
+
+def serialize_rows(rows: List[Dict], columns: List[str], header: bool = True) -> str:
+    # Compact CSV: key names appear once in the header instead of in every record
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(columns)
+    for row in rows:
+        writer.writerow(["" if row.get(col) is None else row.get(col) for col in columns])
+    return buffer.getvalue()
+
+def serialize_records(records: List[Dict]) -> str:
+    return serialize_rows(records, record_columns(records))
+
+def chunk_data(data: List[Dict], token_budget: int = CHUNK_TOKEN_BUDGET) -> List[List[Dict]]:
+    # Packs records into as few chunks as the token budget allows, balanced in size
+    columns = record_columns(data)
+    header_tokens = estimate_tokens(serialize_rows([], columns))
+    row_tokens = [estimate_tokens(serialize_rows([record], columns, header=False)) for record in data]
+    room = max(token_budget - header_tokens, 1)
+    target = sum(row_tokens) / max(math.ceil(sum(row_tokens) / room), 1)
+
+    chunks, current, used = [], [], 0
+    for record, tokens in zip(data, row_tokens):
+        if current and (used + tokens > room or used >= target):
+            chunks.append(current)
+            current, used = [], 0
+        current.append(record)
+        used += tokens
+    if current:
+        chunks.append(current)
+    return chunks
 
-def chunk_data(data: List[Dict], chunk_size: int = 5) -> List[List[Dict]]:
-    # Splits data into manageable chunks for processing
-    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+# Chunks and the search index are built once per dataset snapshot and shared read-only
+social_dataset.register_view("chunks", lambda records: tuple(chunk_data(records)))
+social_dataset.register_view("search_index", BM25Index)
 
+# Send only the top-k records relevant to the question instead of every chunk
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "true").lower() == "true"
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 10))
+
+def select_chunks(user_prompt: str, full_scan: bool = False) -> List[List[Dict]]:
+    # Picks relevant records via the BM25 index, or every chunk when nothing specific matches
+    if RETRIEVAL_ENABLED and not full_scan:
+        records = social_dataset.view("search_index").top_records(user_prompt, RETRIEVAL_TOP_K)
+        if records:
+            return chunk_data(records)
+    return social_dataset.view("chunks")
+
+def generate_text(prompt: str) -> str:
+    # Calls Gemini once per distinct prompt; repeats come from the prompt cache
+    key = prompt_cache.make_key(MODEL_NAME, prompt)
+    return prompt_cache.get_or_compute(key, lambda: call_gemini(prompt).text)
+
+@traced()
 def process_chunk(chunk: List[Dict], user_prompt: str) -> str:
-    # Processes individual data chunk with Gemini API
-    try:
-        context = f"""You are a social media expert known as Quant Ai.
+    # Processes individual data chunk with Gemini API; failures propagate to the caller
+    annotate(records=len(chunk))
+    context = f"""You are a social media expert known as Quant Ai.
         When asked about your identity, always respond that you are Quant Ai.
         
         Please provide detailed, in-depth analysis with the following guidelines:
@@ -34,61 +228,201 @@ def process_chunk(chunk: List[Dict], user_prompt: str) -> str:
         - Use professional but engaging tone
         - Format responses with proper headings and structure
 
-        Based on this social media data:
-        {json.dumps(chunk, indent=2)}
+        Based on this social media data (CSV, one post per row):
+        {serialize_records(chunk)}
 
 """
-        full_prompt = context + user_prompt
-        response = model.generate_content(full_prompt)
-        return response.text
+    full_prompt = context + user_prompt
+    with track_stage("gemini_chunk"):
+        return generate_text(full_prompt)
+
+async def process_chunks_concurrently(chunks: List[List[Dict]], user_prompt: str) -> List:
+    # Handles concurrent processing of multiple data chunks on the shared worker pool;
+    # a failed chunk's exception takes the place of its answer
+    tasks = [run_on_pool(process_chunk, chunk, user_prompt) for chunk in chunks]
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+def collect_answers(responses: List) -> List[str]:
+    # Keeps the successful chunk answers and reports the failed ones;
+    # if every chunk failed there is nothing to merge, so the first error is raised
+    answers = [r for r in responses if not isinstance(r, BaseException)]
+    errors = [r for r in responses if isinstance(r, BaseException)]
+    for error in errors:
+        print(f"❌ Chunk failed: {type(error).__name__}: {str(error)}")
+    if errors and not answers:
+        raise errors[0]
+    if errors:
+        print(f"⚠️ {len(errors)} of {len(responses)} chunks failed, answering from the rest")
+    return answers
+
+def build_merge_prompt(valid_responses: List[str]) -> str:
+    combined = "\n\n".join(valid_responses)
+    return f"Synthesize these insights into a single coherent response:\n{combined}"
+
+# Maximum answers combined by one synthesis call; more are merged in parallel levels first
+MERGE_FAN_IN = max(int(os.getenv("GEMINI_MERGE_FAN_IN", 4)), 2)
+
+@traced()
+def synthesize(group: List[str]) -> str:
+    # Combines a group of answers with one Gemini call, or concatenates them if that fails
+    annotate(answers=len(group))
+    try:
+        with track_stage("gemini_merge"):
+            return generate_text(build_merge_prompt(group))
     except Exception as e:
-        return f"Error processing chunk: {str(e)}"
+        print(f"⚠️ Synthesis failed ({type(e).__name__}: {str(e)}), returning answers unmerged")
+        return "\n\n".join(group)
 
-async def process_chunks_concurrently(chunks: List[List[Dict]], user_prompt: str) -> List[str]:
-    # Handles concurrent processing of multiple data chunks
-    with ThreadPoolExecutor() as executor:
-        loop = asyncio.get_event_loop()
-        tasks = []
-        
-        for chunk in chunks:
-            task = loop.run_in_executor(
-                executor,
-                process_chunk,
-                chunk,
-                user_prompt
-            )
-            tasks.append(task)
-        
-        responses = await asyncio.gather(*tasks)
-        return responses
+async def reduce_responses(valid_responses: List[str]) -> List[str]:
+    # Tree-reduces answers level by level until at most MERGE_FAN_IN remain
+    level = list(valid_responses)
+    while len(level) > MERGE_FAN_IN:
+        groups = [level[i:i + MERGE_FAN_IN] for i in range(0, len(level), MERGE_FAN_IN)]
+        level = await asyncio.gather(*[synthesize_group(group) for group in groups])
+    return level
 
-def merge_responses(responses: List[str]) -> str:
+async def synthesize_group(group: List[str]) -> str:
+    # A lone answer left over at the end of a level passes through untouched
+    if len(group) == 1:
+        return group[0]
+    return await run_on_pool(synthesize, group)
+
+@traced()
+async def merge_responses(responses: List) -> str:
     # Combines and synthesizes multiple chunk responses
-    valid_responses = [r for r in responses if not r.startswith("Error")]
+    valid_responses = collect_answers(responses)
+    annotate(answers=len(valid_responses), failed=len(responses) - len(valid_responses))
     
     if not valid_responses:
         return "Sorry, I couldn't process the data properly."
-    
-    combined = "\n\n".join(valid_responses)
-    
+
+    level = await reduce_responses(valid_responses)
+    if len(level) == 1:
+        # A single answer needs no synthesis round-trip
+        return level[0]
+
+    return await run_on_pool(synthesize, level)
+
+async def stream_generate(prompt: str) -> AsyncIterator[str]:
+    # Streams Gemini output piece by piece; cached prompts are replayed in one piece
+    key = prompt_cache.make_key(MODEL_NAME, prompt)
+    cached = prompt_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+    stop = threading.Event()
+
+    def open_stream():
+        # Opening the stream sends the request, so this is the part that is retried
+        gemini_rate_limiter.acquire()
+        return model.generate_content(prompt, stream=True)
+
+    def produce():
+        parts = []
+        try:
+            raise_if_cancelled()
+            # Hold an in-flight slot for the whole stream, not just the first response
+            with gemini_slots:
+                response = gemini_upstream.call_sync(open_stream, cancel_event=request_cancelled.get())
+                for piece in response:
+                    if stop.is_set():
+                        # The consumer went away; stop reading the upstream stream
+                        return
+                    parts.append(piece.text)
+                    loop.call_soon_threadsafe(queue.put_nowait, piece.text)
+            prompt_cache.set(key, "".join(parts))
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+
+    run_on_pool(produce)
     try:
-        summary_prompt = f"Synthesize these insights into a single coherent response:\n{combined}"
-        final_response = model.generate_content(summary_prompt)
-        return final_response.text
-    except Exception as e:
-        return combined
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+async def stream_prompt_with_data(user_prompt: str, full_scan: bool = False) -> AsyncIterator[Tuple[str, Dict]]:
+    # Streaming pipeline: yields ("chunk", ...) per finished chunk, then ("token", ...) pieces of the answer
+    user_prompt = " ".join(user_prompt.split())
+    chunks = select_chunks(user_prompt, full_scan)
 
-async def process_prompt_with_data(user_prompt: str) -> str:
-    # Main processing pipeline for handling user prompts
+    with cancellation_scope():
+        async with aclosing(_stream_chunks_and_merge(chunks, user_prompt)) as events:
+            async for event in events:
+                yield event
+
+async def _stream_chunks_and_merge(chunks: List[List[Dict]], user_prompt: str) -> AsyncIterator[Tuple[str, Dict]]:
+    async def run(index, chunk):
+        try:
+            return index, await run_on_pool(process_chunk, chunk, user_prompt)
+        except Exception as e:
+            return index, e
+
+    tasks = [asyncio.ensure_future(run(i, chunk)) for i, chunk in enumerate(chunks)]
+    responses = [None] * len(chunks)
     try:
-        data = load_json_data()
-        chunks = chunk_data(data)
-        responses = await process_chunks_concurrently(chunks, user_prompt)
-        return merge_responses(responses)
-    
+        for next_done in asyncio.as_completed(tasks):
+            index, response = await next_done
+            responses[index] = response
+            failed = isinstance(response, Exception)
+            event = {
+                "index": index,
+                "total": len(chunks),
+                "ok": not failed,
+                "text": "" if failed else response
+            }
+            if failed:
+                event["error"] = f"{type(response).__name__}: {str(response)}"
+            yield "chunk", event
+    finally:
+        # Drop chunks that haven't started if the client went away mid-stream
+        for task in tasks:
+            task.cancel()
+
+    valid_responses = collect_answers(responses)
+    if not valid_responses:
+        yield "token", {"text": "Sorry, I couldn't process the data properly."}
+        return
+
+    # Lower merge levels run as in merge_responses; only the final synthesis is streamed
+    level = await reduce_responses(valid_responses)
+    if len(level) == 1:
+        yield "token", {"text": level[0]}
+        return
+
+    streamed = False
+    try:
+        with span("merge_responses", answers=len(level), streamed=True), track_stage("gemini_merge"):
+            async with aclosing(stream_generate(build_merge_prompt(level))) as pieces:
+                async for piece in pieces:
+                    streamed = True
+                    yield "token", {"text": piece}
     except Exception as e:
-        return f"Error: {str(e)}"
+        if streamed:
+            raise
+        # Same fallback as synthesize: the unsynthesized answers
+        yield "token", {"text": "\n\n".join(level)}
+
+async def process_prompt_with_data(user_prompt: str, full_scan: bool = False) -> str:
+    # Main processing pipeline for handling user prompts; errors reach the caller
+    # instead of being returned as answer text
+    # Normalize whitespace so repeated questions hit the prompt cache
+    user_prompt = " ".join(user_prompt.split())
+    chunks = select_chunks(user_prompt, full_scan)
+    with cancellation_scope():
+        responses = await process_chunks_concurrently(chunks, user_prompt)
+        return await merge_responses(responses)
 
-async def handle_prompt(prompt: str) -> str:
+async def handle_prompt(prompt: str, full_scan: bool = False) -> str:
     # FastAPI endpoint handler
-    return await process_prompt_with_data(prompt)
+    return await process_prompt_with_data(prompt, full_scan)
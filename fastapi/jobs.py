@@ -0,0 +1,246 @@
+import asyncio
+import os
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+from tracing import span
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL_STATUSES = frozenset({SUCCEEDED, FAILED, CANCELLED})
+
+# Worker pool and queue limits of background scrape jobs
+SCRAPE_JOB_WORKERS = int(os.getenv("SCRAPE_JOB_WORKERS", 4))
+SCRAPE_JOB_QUEUE_SIZE = int(os.getenv("SCRAPE_JOB_QUEUE_SIZE", 100))
+# How long finished jobs (and their results) stay available for polling
+SCRAPE_JOB_RETENTION_SECS = int(os.getenv("SCRAPE_JOB_RETENTION_SECS", 3600))
+
+class QueueFull(Exception):
+    """The job queue is at capacity; the client should retry later"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} queue is full, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+class Job:
+    """One queued unit of work and, once it finishes, its result or error"""
+
+    def __init__(self, kind: str, key: Hashable, params: dict, run: Callable[[], Awaitable[Any]]):
+        self.id = secrets.token_hex(12)
+        self.kind = kind
+        self.key = key
+        self.params = params
+        self.run = run
+        self.status = QUEUED
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.trace_id: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def set_status(self, status: str) -> None:
+        self.status = status
+        now = time.time()
+        if status == RUNNING:
+            self.started_at = now
+        elif status in TERMINAL_STATUSES:
+            self.finished_at = now
+        # Wake everyone waiting for a change, then arm a fresh event for the next one
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_for_change(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the status changes; False if the timeout passed first"""
+        changed = self._changed
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def to_dict(self, position: Optional[int] = None) -> dict:
+        info = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "params": self.params,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "trace_id": self.trace_id,
+        }
+        if position is not None:
+            info["queue_position"] = position
+        if self.status == SUCCEEDED:
+            info["result"] = self.result
+        if self.error:
+            info["error"] = self.error
+        return info
+
+class JobQueue:
+    """
+    Bounded queue of background jobs run by a fixed pool of workers.
+
+    Submitting returns at once with a queued Job; at most `workers` jobs run
+    concurrently and at most `max_queued` wait, beyond which submit raises
+    QueueFull. Submitting work identical to a queued or running job (same
+    key) returns that job instead of queueing a duplicate. Finished jobs are
+    kept for `retention` seconds so clients can collect their results.
+    """
+
+    def __init__(self, name: str, workers: int = SCRAPE_JOB_WORKERS, max_queued: int = SCRAPE_JOB_QUEUE_SIZE,
+                 retention: float = SCRAPE_JOB_RETENTION_SECS):
+        self.name = name
+        self.workers = max(workers, 1)
+        self.max_queued = max(max_queued, 1)
+        self.retention = retention
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.completed: Dict[str, int] = {SUCCEEDED: 0, FAILED: 0, CANCELLED: 0}
+        self.rejected = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._active: Dict[Hashable, Job] = {}
+        self._pending: List[Job] = []
+        self._worker_tasks: List[asyncio.Task] = []
+        self._job_seconds = 0.0
+        self._stopping = False
+
+    def start(self) -> None:
+        """Startup hook: create the queue and the workers on the running loop"""
+        self._queue = asyncio.Queue()
+        self._stopping = False
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Shutdown hook: stop the workers, cancelling queued and running jobs"""
+        self._stopping = True
+        for job in list(self._pending):
+            self._finish(job, CANCELLED)
+        # Cancelling a worker also cancels the job it is awaiting
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._queue = None
+
+    def submit(self, kind: str, key: Hashable, params: dict, run: Callable[[], Awaitable[Any]]) -> Job:
+        """Queue run() unless an identical job is already queued or running; returns the job"""
+        existing = self._active.get(key)
+        if existing is not None:
+            return existing
+        if self._queue is None:
+            raise RuntimeError(f"{self.name} queue is not running")
+        if len(self._pending) >= self.max_queued:
+            self.rejected += 1
+            raise QueueFull(self.name, self.estimated_wait())
+
+        self._prune()
+        job = Job(kind, key, params, run)
+        self.jobs[job.id] = job
+        self._active[key] = job
+        self._pending.append(job)
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._prune()
+        return self.jobs.get(job_id)
+
+    def position(self, job: Job) -> Optional[int]:
+        """1-based place of a queued job in line, None once it has started"""
+        try:
+            return self._pending.index(job) + 1
+        except ValueError:
+            return None
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued or running job; finished jobs are left as they are"""
+        job = self.jobs.get(job_id)
+        if job is None or job.done:
+            return job
+        if job.status == QUEUED:
+            # The worker that dequeues it skips it
+            self._finish(job, CANCELLED)
+        elif job.task is not None:
+            job.task.cancel()
+        return job
+
+    def estimated_wait(self) -> float:
+        # Average job duration times the number of rounds the workers need to clear the queue
+        finished = sum(self.completed.values())
+        average = self._job_seconds / finished if finished else 30.0
+        return max(average * (len(self._pending) / self.workers + 1), 1.0)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "queued": len(self._pending),
+            "running": sum(1 for job in self._active.values() if job.status == RUNNING),
+            "retained": len(self.jobs),
+            "rejected": self.rejected,
+            **{f"total_{status}": count for status, count in self.completed.items()},
+        }
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status != QUEUED:
+                    continue
+                self._pending.remove(job)
+                await self._execute(job)
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, job: Job) -> None:
+        job.set_status(RUNNING)
+        # Each job is its own trace, since the request that submitted it is long gone
+        with span(f"{job.kind}_job", job_id=job.id) as root:
+            job.trace_id = root.trace_id
+            job.task = asyncio.create_task(job.run())
+            try:
+                job.result = await job.task
+            except asyncio.CancelledError:
+                self._finish(job, CANCELLED)
+                if self._stopping:
+                    raise
+                # Only the job was cancelled; the worker carries on
+                root.status = "cancelled"
+                return
+            except Exception as e:
+                job.error = str(e)
+                root.status, root.error = "error", f"{type(e).__name__}: {str(e)}"
+                print(f"❌ {job.kind} job {job.id} failed: {str(e)}")
+                self._finish(job, FAILED)
+                return
+            finally:
+                job.task = None
+        self._finish(job, SUCCEEDED)
+
+    def _finish(self, job: Job, status: str) -> None:
+        if job.done:
+            return
+        if job in self._pending:
+            self._pending.remove(job)
+        if self._active.get(job.key) is job:
+            del self._active[job.key]
+        if job.started_at is not None:
+            self._job_seconds += time.time() - job.started_at
+        self.completed[status] += 1
+        job.set_status(status)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.done and job.finished_at < cutoff]:
+            del self.jobs[job_id]
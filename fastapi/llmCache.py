@@ -0,0 +1,182 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+from cache import TTLCache, HIT
+
+class ComputationCancelled(Exception):
+    """Raised by a compute function whose caller went away; waiters retry instead of failing"""
+
+class PromptCache:
+    """
+    Content-addressed cache for LLM responses.
+
+    Keys are sha256 hashes of the model name and prompt text. Lookups go to an
+    in-memory LRU first and then to an optional on-disk tier, which evicts the
+    least recently used files once it grows past max_disk_bytes. Identical
+    prompts requested while one is already in flight wait for that call.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 86400, disk_dir: Optional[str] = None,
+                 max_disk_bytes: int = 100 * 1024 * 1024):
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_hits = 0
+        self.coalesced = 0
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._disk_index: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def make_key(model_name: str, *parts: str) -> str:
+        digest = hashlib.sha256(model_name.encode("utf-8"))
+        for part in parts:
+            digest.update(b"\0")
+            digest.update(part.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        value, status = self.memory.get_with_status(key)
+        if status == HIT:
+            return value
+        value = self._disk_get(key)
+        if value is not None:
+            self.disk_hits += 1
+            self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        self._disk_set(key, value)
+
+    def get_or_compute(self, key: str, compute: Callable[[], str]) -> str:
+        """Return the cached value, or run compute once for all concurrent callers"""
+        while True:
+            value = self.get(key)
+            if value is not None:
+                return value
+
+            with self._lock:
+                future = self._inflight.get(key)
+                if future is None:
+                    # A leader may have stored the value and finished since the lookup above
+                    value = self.memory.peek(key)
+                    if value is not None:
+                        return value
+                leader = future is None
+                if leader:
+                    future = Future()
+                    self._inflight[key] = future
+                else:
+                    self.coalesced += 1
+
+            if leader:
+                break
+            try:
+                return future.result()
+            except ComputationCancelled:
+                # The leader's request was cancelled; take over the computation
+                continue
+
+        try:
+            value = compute()
+        except BaseException as e:
+            # Failures are shared with waiting callers but never cached
+            self._finish(key)
+            future.set_exception(e)
+            raise
+
+        self.set(key, value)
+        self._finish(key)
+        future.set_result(value)
+        return value
+
+    def _finish(self, key: str) -> None:
+        # Unregister before resolving so retrying waiters never see a finished future
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            **self.memory.stats(),
+            "disk_hits": self.disk_hits,
+            "disk_entries": len(self._disk_index),
+            "disk_bytes": self._disk_bytes,
+            "coalesced": self.coalesced
+        }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.txt")
+
+    def _load_disk_index(self) -> None:
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and entry.name.endswith(".txt"):
+                stat = entry.stat()
+                entries.append((stat.st_atime, entry.name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk_index[key] = size
+            self._disk_bytes += size
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        if not self.disk_dir:
+            return None
+        with self._lock:
+            if key not in self._disk_index:
+                return None
+            self._disk_index.move_to_end(key)
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                self._disk_remove(key)
+                return None
+            with open(path, "r", encoding="utf-8") as file:
+                return file.read()
+        except OSError:
+            self._disk_remove(key)
+            return None
+
+    def _disk_set(self, key: str, value: str) -> None:
+        if not self.disk_dir:
+            return
+        data = value.encode("utf-8")
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"❌ Error writing prompt cache entry: {str(e)}")
+            return
+
+        with self._lock:
+            self._disk_bytes += len(data) - self._disk_index.pop(key, 0)
+            self._disk_index[key] = len(data)
+            evicted = []
+            while self._disk_bytes > self.max_disk_bytes and len(self._disk_index) > 1:
+                old_key, size = self._disk_index.popitem(last=False)
+                self._disk_bytes -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def _disk_remove(self, key: str) -> None:
+        with self._lock:
+            self._disk_bytes -= self._disk_index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
@@ -2,19 +2,150 @@ from typing import Union
 from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel, validator
 import json
-import requests
-from typing import Optional, Dict, Any
+import math
+import time
+import hashlib
+import asyncio
+import aiohttp
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, Tuple, AsyncIterator, List
 from scrap import scrape_instagram_profile
+from cache import TTLCache
+import vectorStaxConnect
 from dotenv import load_dotenv
 import os
 import logging
 from fastapi.middleware.cors import CORSMiddleware
-from geminiFunc import handle_prompt
+from fastapi.responses import StreamingResponse, Response, JSONResponse, PlainTextResponse
+import geminiFunc
+import resilience
+from resilience import Upstream, CircuitOpenError, upstream_stats, open_circuits
+import scrap
+from tracing import span, traced, annotate, trace_store, waterfall, TracingMiddleware
+from jobs import JobQueue, QueueFull, SUCCEEDED
+from metrics import registry, track_stage, register_caches, MetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from geminiFunc import handle_prompt, stream_prompt_with_data
+from analytics import get_engine, build_visualization
+from dataset import social_dataset
 import uvicorn
 
 load_dotenv()
 
-app = FastAPI()
+# Add logging configuration
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# HTTP client configuration (shared keep-alive pool for Langflow calls)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 100))
+HTTP_POOL_SIZE_PER_HOST = int(os.getenv("HTTP_POOL_SIZE_PER_HOST", 20))
+HTTP_KEEPALIVE_SECS = float(os.getenv("HTTP_KEEPALIVE_SECS", 30))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 10))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 120))
+
+http_session: Optional[aiohttp.ClientSession] = None
+
+def create_http_session() -> aiohttp.ClientSession:
+    """Create the process-wide HTTP session with pool limits and timeouts"""
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_SIZE,
+        limit_per_host=HTTP_POOL_SIZE_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_SECS
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=None,
+        connect=HTTP_CONNECT_TIMEOUT,
+        sock_read=HTTP_READ_TIMEOUT
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Return the shared HTTP session, creating it if startup hasn't run"""
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = create_http_session()
+    return http_session
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open shared clients on startup and close them on shutdown
+    global http_session
+    http_session = create_http_session()
+    await vectorStaxConnect.connect()
+    social_dataset.snapshot()  # Parse data.json once per process before serving
+    scrape_jobs.start()
+    try:
+        yield
+    finally:
+        await scrape_jobs.stop()
+        await http_session.close()
+        http_session = None
+        await vectorStaxConnect.close()
+        geminiFunc.shutdown()
+        resilience.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+# Background scrapes submitted through /scrape-jobs, run by a bounded worker pool
+scrape_jobs = JobQueue("scrape")
+
+# How often long-running endpoints check whether the client is still connected
+DISCONNECT_POLL_SECS = float(os.getenv("DISCONNECT_POLL_SECS", 1))
+
+class ClientDisconnected(Exception):
+    """The client went away before the response was ready"""
+
+async def run_until_disconnected(request: Request, coro):
+    """
+    Await coro, cancelling it if the client disconnects first.
+
+    Cancellation propagates into the pipelines: pending Gemini calls are
+    skipped, the Langflow request is closed and Apify runs are aborted.
+    """
+    task = asyncio.ensure_future(coro)
+
+    async def wait_for_disconnect():
+        while not await request.is_disconnected():
+            await asyncio.sleep(DISCONNECT_POLL_SECS)
+
+    watcher = asyncio.create_task(wait_for_disconnect())
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    if task.cancelled():
+        logger.info(f"Client disconnected from {request.url.path}, upstream work cancelled")
+        raise ClientDisconnected()
+    return task.result()
+
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    # Nobody is listening; 499 is the conventional status for a client-closed request
+    return Response(status_code=499)
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    # An upstream is known to be down: fail fast and tell the client when to retry
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+@app.exception_handler(QueueFull)
+async def queue_full_handler(request: Request, exc: QueueFull):
+    # Shed load instead of queueing without bound; Retry-After estimates when a slot frees up
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
 
 # Configure CORS
 app.add_middleware(
@@ -23,8 +154,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the browser client read the job, cache and tracing headers on cross-origin responses
+    expose_headers=["Retry-After", "Location", "X-Cache", "X-Trace-Id"],
 )
 
+# Request counts, latency histograms and in-flight requests per endpoint, served at /metrics
+app.add_middleware(MetricsMiddleware)
+# Root span per request and X-Trace-Id response header; traces are served at /debug/traces
+app.add_middleware(TracingMiddleware)
+
 # CONFIGURATION
 BASE_API_URL = os.getenv("BASE_API_URL")
 LANGFLOW_ID = os.getenv("LANGFLOW_ID")
@@ -32,6 +170,16 @@ FLOW_ID = os.getenv("FLOW_ID")
 APPLICATION_TOKEN = os.getenv("APPLICATION_TOKEN")
 ENDPOINT = FLOW_ID
 
+# Retry/backoff, optional hedging and circuit breaking for Langflow calls (LANGFLOW_RETRY_* etc.)
+langflow_upstream = Upstream.from_env("langflow", "LANGFLOW", attempts=2)
+
+# Cache of Langflow responses so repeated questions don't cost another agent run
+FLOW_CACHE_ENABLED = os.getenv("FLOW_CACHE_ENABLED", "true").lower() == "true"
+FLOW_CACHE_SIZE = int(os.getenv("FLOW_CACHE_SIZE", 256))
+FLOW_CACHE_TTL = int(os.getenv("FLOW_CACHE_TTL", 300))
+
+flow_cache = TTLCache(maxsize=FLOW_CACHE_SIZE, ttl=FLOW_CACHE_TTL)
+
 # TweaksWhat are the main trends in engagement across the posts?
 TWEAKS = {
     "ChatInput-PVxoG": {},
@@ -54,17 +202,15 @@ class FlowRequest(BaseModel):
     tweaks: Optional[Dict[str, Any]] = TWEAKS
     output_type: str = "chat"
     input_type: str = "chat"
-
-# Add logging configuration
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-async def run_flow(message: str,
-                  endpoint: str,
-                  output_type: str = "chat",
-                  input_type: str = "chat",
-                  tweaks: Optional[dict] = None) -> dict:
-    """Run a flow with a given message and optional tweaks."""
+    no_cache: bool = False  # Skip the response cache and always run the flow
+    stream: bool = False  # Stream Server-Sent Events instead of one JSON response
+
+def build_flow_request(message: str,
+                       endpoint: str,
+                       output_type: str = "chat",
+                       input_type: str = "chat",
+                       tweaks: Optional[dict] = None) -> Tuple[str, dict, dict]:
+    """Return the URL, payload and headers of a Langflow run request"""
     api_url = f"{BASE_API_URL}/lf/{LANGFLOW_ID}/api/v1/run/{endpoint}"
 
     payload = {
@@ -81,23 +227,246 @@ async def run_flow(message: str,
     if tweaks:
         payload["tweaks"] = tweaks
 
+    return api_url, payload, headers
+
+@traced()
+async def run_flow(message: str,
+                  endpoint: str,
+                  output_type: str = "chat",
+                  input_type: str = "chat",
+                  tweaks: Optional[dict] = None) -> dict:
+    """Run a flow with a given message and optional tweaks."""
+    api_url, payload, headers = build_flow_request(message, endpoint, output_type, input_type, tweaks)
+
+    async def post_flow():
+        session = get_http_session()
+        async with session.post(api_url, json=payload, headers=headers) as response:
+            if response.status >= 400:
+                logger.error(f"Response text: {await response.text()}")
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
     try:
-        response = requests.post(api_url, json=payload, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
+        with track_stage("langflow"):
+            return await langflow_upstream.call(post_flow)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         logger.error(f"Request failed: {str(e)}")
-        if hasattr(e.response, 'text'):
-            logger.error(f"Response text: {e.response.text}")
         raise HTTPException(
             status_code=500, 
             detail=f"Flow execution failed: {str(e)}"
         )
 
+def parse_flow_event(line: bytes) -> Optional[Tuple[str, dict]]:
+    # Langflow writes one JSON object per event, with or without an SSE "data:" prefix
+    text = line.decode("utf-8").strip()
+    if text.startswith("data:"):
+        text = text[5:].strip()
+    if not text:
+        return None
+    try:
+        event = json.loads(text)
+    except ValueError:
+        logger.warning(f"Skipping malformed Langflow stream line: {text[:200]}")
+        return None
+    return event.get("event", "message"), event.get("data") or {}
+
+async def stream_flow(message: str,
+                      endpoint: str,
+                      output_type: str = "chat",
+                      input_type: str = "chat",
+                      tweaks: Optional[dict] = None) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Run a flow in Langflow's streaming mode and yield its (event, data) pairs.
+
+    Events include "token" (a piece of the answer), "add_message" (the message
+    so far, with agent steps), "error" and a final "end" carrying the same
+    result run_flow returns. Langflow versions that don't stream answer with
+    plain JSON, which is yielded as a single "end" event.
+    """
+    api_url, payload, headers = build_flow_request(message, endpoint, output_type, input_type, tweaks)
+    session = get_http_session()
+
+    async def open_stream():
+        # Only opening the stream is retried; once events flow they are relayed as they come
+        response = await session.post(api_url, params={"stream": "true"}, json=payload, headers=headers)
+        if response.status >= 400:
+            logger.error(f"Response text: {await response.text()}")
+        response.raise_for_status()
+        return response
+
+    with span("run_flow", stream=True), track_stage("langflow"):
+        async for event in read_flow_stream(await langflow_upstream.call(open_stream)):
+            yield event
+
+async def read_flow_stream(response: aiohttp.ClientResponse) -> AsyncIterator[Tuple[str, dict]]:
+    """Yield the (event, data) pairs of an open Langflow response, closing it at the end"""
+    try:
+        if "application/json" in response.headers.get("Content-Type", ""):
+            yield "end", {"result": await response.json(content_type=None)}
+            return
+
+        # Split on newlines by hand: the final event can exceed aiohttp's readline limit
+        buffer = b""
+        async for data in response.content.iter_any():
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                event = parse_flow_event(line)
+                if event:
+                    yield event
+        event = parse_flow_event(buffer)
+        if event:
+            yield event
+    finally:
+        # Also reached when the client disconnects, which closes the Langflow connection
+        response.close()
+
+def flow_cache_key(message: str, endpoint: str, output_type: str, input_type: str,
+                   tweaks: Optional[dict]) -> tuple:
+    # Whitespace and case don't change the question; tweaks are hashed in canonical JSON form
+    tweaks_hash = hashlib.sha256(
+        json.dumps(tweaks or {}, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    return (" ".join(message.split()).casefold(), endpoint, output_type, input_type, tweaks_hash)
+
+async def run_flow_cached(message: str,
+                          endpoint: str,
+                          output_type: str = "chat",
+                          input_type: str = "chat",
+                          tweaks: Optional[dict] = None,
+                          use_cache: bool = True) -> Tuple[dict, str, Optional[int]]:
+    """
+    Run a flow through the response cache.
+
+    Returns (raw response, cache status, age in seconds) where the status is
+    HIT, MISS or BYPASS. A bypassed run still refreshes the cached entry.
+    Only responses that contain outputs are cached.
+    """
+    if not FLOW_CACHE_ENABLED:
+        raw_response = await run_flow(message, endpoint, output_type, input_type, tweaks)
+        return raw_response, "BYPASS", None
+
+    key = flow_cache_key(message, endpoint, output_type, input_type, tweaks)
+    if use_cache:
+        cached = cached_flow_response(key)
+        if cached is not None:
+            raw_response, age = cached
+            return raw_response, "HIT", age
+
+    raw_response = await run_flow(message, endpoint, output_type, input_type, tweaks)
+    store_flow_response(key, raw_response)
+    return raw_response, "MISS" if use_cache else "BYPASS", None
+
+def cached_flow_response(key: tuple) -> Optional[Tuple[dict, int]]:
+    """Return (raw response, age in seconds) for a cached flow run, or None"""
+    cached = flow_cache.get(key)
+    if cached is None:
+        return None
+    raw_response, stored_at = cached
+    return raw_response, int(time.time() - stored_at)
+
+def store_flow_response(key: tuple, raw_response: dict) -> None:
+    if FLOW_CACHE_ENABLED and isinstance(raw_response, dict) and raw_response.get('outputs'):
+        flow_cache.set(key, (raw_response, time.time()))
+
+def wants_fresh(http_request: Request) -> bool:
+    # Clients can also skip the cache with a standard Cache-Control: no-cache header
+    return "no-cache" in http_request.headers.get("cache-control", "").lower()
+
+def set_cache_headers(response: Response, status: str, age: Optional[int]) -> None:
+    response.headers["X-Cache"] = status
+    if age is not None:
+        response.headers["Age"] = str(age)
+
+def extract_agent_steps(message: dict) -> List[list]:
+    """Return the contents of every 'Agent Steps' block of a Langflow message"""
+    return [
+        block.get('contents', [])
+        for block in message.get('content_blocks', [])
+        if block.get('title') == 'Agent Steps'
+    ]
+
+def sse_event(event: str, payload: Any) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"  # Stop reverse proxies from buffering the stream
+}
+
+async def stream_flow_response(request: FlowRequest, key: tuple, cached: Optional[dict]) -> AsyncIterator[str]:
+    """
+    Stream /run-flow as SSE: 'agent_step' events as the agent works, 'token'
+    events with pieces of the answer and a final 'done' event whose payload is
+    the clean_response body the non-streaming endpoint returns. Failures end
+    the stream with an 'error' event instead.
+    """
+    def final_frame(formatted):
+        if formatted.get("status") == "error":
+            return sse_event("error", {"status": "error", "detail": formatted.get("message", "Unknown error occurred")})
+        return sse_event("done", formatted)
+
+    if cached is not None:
+        # Replay a cached run: its steps, the whole answer as one token, then the final frame
+        formatted = clean_response(cached)
+        if formatted.get("status") == "success":
+            for block, contents in enumerate(formatted.get('agent_steps', [])):
+                for index, step in enumerate(contents):
+                    yield sse_event("agent_step", {"block": block, "index": index, "step": step})
+            yield sse_event("token", {"text": formatted["message"]["text"]})
+        yield final_frame(formatted)
+        return
+
+    sent_steps: Dict[Tuple[int, int], str] = {}
+    streamed_text = False
+    try:
+        async for event, data in stream_flow(
+            message=request.message,
+            endpoint=ENDPOINT,
+            output_type=request.output_type,
+            input_type=request.input_type,
+            tweaks=request.tweaks
+        ):
+            if event == "token":
+                chunk = data.get("chunk", "")
+                if chunk:
+                    streamed_text = True
+                    yield sse_event("token", {"text": chunk})
+            elif event == "add_message" and data.get("sender") != "User":
+                # Messages are re-sent as the agent works; relay only new or changed steps
+                for block, contents in enumerate(extract_agent_steps(data)):
+                    for index, step in enumerate(contents):
+                        signature = json.dumps(step, sort_keys=True, default=str)
+                        if sent_steps.get((block, index)) != signature:
+                            sent_steps[(block, index)] = signature
+                            yield sse_event("agent_step", {"block": block, "index": index, "step": step})
+            elif event == "error":
+                detail = data.get("error") or data.get("text") or "Flow execution failed"
+                yield sse_event("error", {"status": "error", "detail": str(detail)})
+                return
+            elif event == "end":
+                raw_response = data.get("result") or {}
+                formatted = clean_response(raw_response)
+                if not streamed_text and formatted.get("status") == "success":
+                    # The flow's model didn't stream tokens; send the whole answer at once
+                    yield sse_event("token", {"text": formatted["message"]["text"]})
+                store_flow_response(key, raw_response)
+                yield final_frame(formatted)
+                return
+    except Exception as e:
+        logger.error(f"Flow stream failed: {str(e)}")
+        yield sse_event("error", {"status": "error", "detail": f"Flow execution failed: {str(e)}"})
+        return
+
+    yield sse_event("error", {"status": "error", "detail": "Flow stream ended without a result"})
+
 def clean_response(raw_response):
     """Clean and format the Langflow response"""
     try:
-        logger.info(f"Raw response: {json.dumps(raw_response, indent=2)}")
+        # Raw responses can be large, so they are only serialized and logged when debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Raw response: {json.dumps(raw_response)}")
         
         if not raw_response.get('outputs'):
             return {
@@ -129,13 +498,8 @@ def clean_response(raw_response):
         }
 
         # Extract content blocks if they exist
-        content_blocks = message.get('content_blocks', [])
-        if content_blocks:
-            cleaned_response['agent_steps'] = [
-                block.get('contents', [])
-                for block in content_blocks
-                if block.get('title') == 'Agent Steps'
-            ]
+        if message.get('content_blocks'):
+            cleaned_response['agent_steps'] = extract_agent_steps(message)
 
         return cleaned_response
 
@@ -151,20 +515,44 @@ def read_root():
     return {"Applicaiton Working": "True"}
 
 @app.post("/run-flow")
-async def process_flow(request: FlowRequest):
+async def process_flow(request: FlowRequest, http_request: Request, response: Response):
     """
     Process a flow with the given message and parameters
+
+    Repeated questions are answered from the response cache (X-Cache: HIT);
+    send no_cache or Cache-Control: no-cache to force a fresh run. With
+    stream or Accept: text/event-stream the answer is relayed as SSE.
     """
     try:
         logger.info(f"Processing request with message: {request.message}")
+
+        use_cache = not (request.no_cache or wants_fresh(http_request))
+        if request.stream or "text/event-stream" in http_request.headers.get("accept", ""):
+            key = flow_cache_key(request.message, ENDPOINT, request.output_type,
+                                 request.input_type, request.tweaks)
+            cached = cached_flow_response(key) if FLOW_CACHE_ENABLED and use_cache else None
+            if not FLOW_CACHE_ENABLED or not use_cache:
+                cache_headers = {"X-Cache": "BYPASS"}
+            elif cached is None:
+                cache_headers = {"X-Cache": "MISS"}
+            else:
+                cache_headers = {"X-Cache": "HIT", "Age": str(cached[1])}
+            return StreamingResponse(
+                stream_flow_response(request, key, cached[0] if cached else None),
+                media_type="text/event-stream",
+                headers={**SSE_HEADERS, **cache_headers}
+            )
         
-        raw_response = await run_flow(
+        raw_response, cache_status, age = await run_until_disconnected(http_request, run_flow_cached(
             message=request.message,
             endpoint=ENDPOINT,
             output_type=request.output_type,
             input_type=request.input_type,
-            tweaks=request.tweaks
-        )
+            tweaks=request.tweaks,
+            use_cache=use_cache
+        ))
+        set_cache_headers(response, cache_status, age)
+        annotate(cache=cache_status)
         
         # Format the response
         formatted_response = clean_response(raw_response)
@@ -177,7 +565,7 @@ async def process_flow(request: FlowRequest):
             
         return formatted_response
         
-    except HTTPException:
+    except (HTTPException, ClientDisconnected, CircuitOpenError):
         raise
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
@@ -186,22 +574,94 @@ async def process_flow(request: FlowRequest):
             detail=f"An unexpected error occurred: {str(e)}"
         )
 
+CIRCUIT_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+def collect_upstream_metrics():
+    # Breaker state and retry/hedge counters of every upstream, read at scrape time
+    stats = upstream_stats()
+    return [
+        ("upstream_circuit_state", "gauge", "Circuit breaker state (0 closed, 1 half-open, 2 open)",
+         [({"upstream": name}, CIRCUIT_STATE_VALUES[s["state"]]) for name, s in stats.items()]),
+        ("upstream_retries_total", "counter", "Attempts retried after a transient failure",
+         [({"upstream": name}, s["retries"]) for name, s in stats.items()]),
+        ("upstream_hedges_total", "counter", "Hedged duplicate attempts started",
+         [({"upstream": name}, s["hedges"]) for name, s in stats.items()]),
+        ("scrapes_in_flight", "gauge", "Profile scrapes currently running",
+         [({}, len(scrap._inflight_scrapes))]),
+    ]
+
+registry.register_collector(collect_upstream_metrics)
+
+def collect_job_metrics():
+    stats = scrape_jobs.stats()
+    return [
+        ("scrape_jobs_queued", "gauge", "Scrape jobs waiting for a worker", [({}, stats["queued"])]),
+        ("scrape_jobs_running", "gauge", "Scrape jobs being run by a worker", [({}, stats["running"])]),
+        ("scrape_jobs_total", "counter", "Finished scrape jobs by outcome",
+         [({"status": status}, stats[f"total_{status}"]) for status in ("succeeded", "failed", "cancelled")]),
+        ("scrape_jobs_rejected_total", "counter", "Scrape jobs refused because the queue was full",
+         [({}, stats["rejected"])]),
+    ]
+
+registry.register_collector(collect_job_metrics)
+register_caches(lambda: {
+    "profile": scrap.profile_cache.stats(),
+    "flow": flow_cache.stats(),
+    "prompt": geminiFunc.prompt_cache.stats()
+})
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Prometheus text-format metrics"""
+    return Response(registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/debug/traces", include_in_schema=False)
+async def list_traces(min_duration_ms: float = 0, limit: int = 50):
+    """Recent traces, newest first; min_duration_ms keeps only the slow ones"""
+    return {"traces": trace_store.summaries(min_duration_ms, limit)}
+
+@app.get("/debug/traces/{trace_id}", include_in_schema=False)
+async def get_trace(trace_id: str, format: str = "json"):
+    """All spans of one trace, as JSON or (format=text) as a waterfall"""
+    spans = trace_store.get(trace_id)
+    if spans is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    if format == "text":
+        return PlainTextResponse(waterfall(spans))
+    return {"trace_id": trace_id, "spans": sorted(spans, key=lambda s: s["start"])}
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}  #124 lines
+    # Degraded while any upstream circuit breaker is open or probing
+    return {
+        "status": "degraded" if open_circuits() else "healthy",
+        "upstreams": upstream_stats(),
+        "scrape_jobs": scrape_jobs.stats()
+    }
+
+def check_results_limit(v):
+    if v < 1:
+        raise ValueError('results_limit must be at least 1')
+    if v > 50:  # Set a reasonable maximum
+        raise ValueError('results_limit cannot exceed 50')
+    return v
 
 class InstagramRequest(BaseModel):
     username: str
     results_limit: int = 5
+    incremental: Optional[bool] = None  # None uses the INCREMENTAL_SCRAPE default
+
+    @validator('username')
+    def validate_username(cls, v):
+        v = scrap.normalize_username(v)
+        if not v:
+            raise ValueError('username must not be empty')
+        return v
 
     @validator('results_limit')
     def validate_results_limit(cls, v):
-        if v < 1:
-            raise ValueError('results_limit must be at least 1')
-        if v > 50:  # Set a reasonable maximum
-            raise ValueError('results_limit cannot exceed 50')
-        return v
+        return check_results_limit(v)
 
     class Config:
         json_schema_extra = {
@@ -211,6 +671,33 @@ class InstagramRequest(BaseModel):
             }
         }
 
+# Most usernames accepted by one batch scrape request
+SCRAPE_BATCH_MAX_USERNAMES = int(os.getenv("SCRAPE_BATCH_MAX_USERNAMES", 500))
+
+class BatchInstagramRequest(BaseModel):
+    usernames: List[str]
+    results_limit: int = 5
+
+    @validator('usernames')
+    def validate_usernames(cls, v):
+        if not any(scrap.normalize_username(username) for username in v):
+            raise ValueError('usernames must not be empty')
+        if len(v) > SCRAPE_BATCH_MAX_USERNAMES:
+            raise ValueError(f'usernames cannot have more than {SCRAPE_BATCH_MAX_USERNAMES} entries')
+        return v
+
+    @validator('results_limit')
+    def validate_results_limit(cls, v):
+        return check_results_limit(v)
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "usernames": ["cristiano", "natgeo", "nasa"],
+                "results_limit": 12
+            }
+        }
+
 class PostInsertStatus(BaseModel):
     post_id: str
     post_data: dict
@@ -228,35 +715,174 @@ class InstagramResponse(BaseModel):
     db_message: str
 
 @app.post("/scrape-instagram", response_model=InstagramResponse)
-async def scrape_instagram(request: InstagramRequest):
+async def scrape_instagram(request: InstagramRequest, http_request: Request):
     """
     Scrape Instagram profile and posts data
     
     Parameters:
     - username: Instagram username to scrape
     - results_limit: Number of posts to fetch (default: 5)
+    - incremental: Only fetch posts newer than the stored snapshot
     """
     try:
-        result = await scrape_instagram_profile(request.username, request.results_limit)
+        result = await run_until_disconnected(http_request, scrape_instagram_profile(
+            request.username,
+            request.results_limit,
+            incremental=request.incremental
+        ))
         if result['success']:
-            # Add total_posts to the result
-            result['total_posts'] = result['profile_data'].get('total_posts', len(result['posts_data']))
-            return result
+            return with_total_posts(result)
         else:
             raise HTTPException(status_code=400, detail=result['error'])
+    except (ClientDisconnected, CircuitOpenError):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def with_total_posts(result: dict) -> dict:
+    # Add total_posts to the result
+    result['total_posts'] = result['profile_data'].get('total_posts', len(result['posts_data']))
+    return result
+
+def batch_response(batch: dict) -> dict:
+    """Shape each username's result like a /scrape-instagram response, or an error"""
+    results = {}
+    for username, result in batch['results'].items():
+        if result['success']:
+            results[username] = InstagramResponse(**with_total_posts(result)).model_dump()
+        else:
+            results[username] = {"success": False, "error": result['error']}
+    return {**batch, "results": results}
+
+@app.post("/scrape-instagram/batch")
+async def scrape_instagram_batch(request: BatchInstagramRequest, http_request: Request):
+    """
+    Scrape many usernames with multi-URL actor runs (APIFY_BATCH_SIZE per run)
+    and store them in bulk. Each username gets its own result, so one failed
+    profile doesn't fail the batch. For large batches use POST
+    /scrape-jobs/batch instead of holding this request open.
+    """
+    try:
+        batch = await run_until_disconnected(http_request, scrap.scrape_and_store_profiles(
+            request.usernames,
+            request.results_limit
+        ))
+        return batch_response(batch)
+    except (ClientDisconnected, CircuitOpenError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+# Longest a status request may wait for a job to change before answering
+JOB_WAIT_MAX_SECS = 60
+# Comment frames keep idle job event streams from being cut off by proxies
+JOB_KEEPALIVE_SECS = 15
+
+async def run_scrape_job(request: InstagramRequest) -> dict:
+    """Scrape as /scrape-instagram does, returning its response body or raising its error"""
+    result = await scrape_instagram_profile(
+        request.username,
+        request.results_limit,
+        incremental=request.incremental
+    )
+    if not result['success']:
+        raise Exception(result['error'])
+    return InstagramResponse(**with_total_posts(result)).model_dump()
+
+async def run_batch_scrape_job(request: BatchInstagramRequest) -> dict:
+    return batch_response(await scrap.scrape_and_store_profiles(request.usernames, request.results_limit))
+
+def job_view(job) -> dict:
+    return job.to_dict(position=scrape_jobs.position(job))
+
+def get_job_or_404(job_id: str):
+    job = scrape_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+@app.post("/scrape-jobs", status_code=202)
+async def submit_scrape_job(request: InstagramRequest, response: Response):
+    """
+    Queue a scrape and return its job ID at once, instead of holding the
+    request open while the actors run. Poll GET /scrape-jobs/{job_id} or
+    subscribe to GET /scrape-jobs/{job_id}/events for the result. A scrape
+    identical to one already queued or running returns that job.
+    """
+    key = scrap.profile_cache_key(request.username, request.results_limit, request.incremental)
+    job = scrape_jobs.submit("scrape", key, request.model_dump(), lambda: run_scrape_job(request))
+    response.headers["Location"] = f"/scrape-jobs/{job.id}"
+    return job_view(job)
+
+@app.post("/scrape-jobs/batch", status_code=202)
+async def submit_batch_scrape_job(request: BatchInstagramRequest, response: Response):
+    """Queue a batch scrape as one job; its result is the /scrape-instagram/batch response"""
+    key = ("batch", tuple(scrap.normalize_usernames(request.usernames)), request.results_limit)
+    job = scrape_jobs.submit("scrape_batch", key, request.model_dump(), lambda: run_batch_scrape_job(request))
+    response.headers["Location"] = f"/scrape-jobs/{job.id}"
+    return job_view(job)
+
+@app.get("/scrape-jobs")
+async def scrape_job_stats():
+    """Worker pool and queue depth of the scrape job queue"""
+    return scrape_jobs.stats()
+
+@app.get("/scrape-jobs/{job_id}")
+async def get_scrape_job(job_id: str, wait: float = 0):
+    """
+    Status of a job, with the scrape result once it has succeeded.
+    wait (seconds, up to 60) holds the request until the status changes.
+    """
+    job = get_job_or_404(job_id)
+    if wait > 0 and not job.done:
+        await job.wait_for_change(min(wait, JOB_WAIT_MAX_SECS))
+    return job_view(job)
+
+@app.delete("/scrape-jobs/{job_id}")
+async def cancel_scrape_job(job_id: str):
+    """Cancel a queued or running job; running scrapes abort their actor runs"""
+    job = get_job_or_404(job_id)
+    scrape_jobs.cancel(job_id)
+    if job.task is not None:
+        # Let the worker record the cancellation before answering
+        await job.wait_for_change(5)
+    return job_view(job)
+
+async def stream_job_events(job) -> AsyncIterator[str]:
+    """'status' events on every change, then 'done' with the result or 'error'"""
+    sent_status = None
+    while True:
+        if job.done:
+            event = "done" if job.status == SUCCEEDED else "error"
+            yield sse_event(event, job_view(job))
+            return
+        if job.status != sent_status:
+            sent_status = job.status
+            yield sse_event("status", job_view(job))
+        # Changes made while paused at a yield are caught by comparing with what was sent
+        if job.done or job.status != sent_status:
+            continue
+        if not await job.wait_for_change(JOB_KEEPALIVE_SECS):
+            yield ": keep-alive\n\n"
+
+@app.get("/scrape-jobs/{job_id}/events")
+async def scrape_job_events(job_id: str):
+    """Server-Sent Events stream of a job's status changes"""
+    job = get_job_or_404(job_id)
+    return StreamingResponse(stream_job_events(job), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.get("/test-config")    
-async def test_configuration():
-    """Test the configuration and connections"""
+async def test_configuration(http_request: Request, response: Response, no_cache: bool = False):
+    """Test the configuration and connections (cached like /run-flow unless no_cache is set)"""
     try:
         # Test basic message
-        test_response = await run_flow(
+        test_response, cache_status, age = await run_until_disconnected(http_request, run_flow_cached(
             message="Hello, this is a test message",
             endpoint=ENDPOINT,
-            tweaks=TWEAKS
-        )
+            tweaks=TWEAKS,
+            use_cache=not (no_cache or wants_fresh(http_request))
+        ))
+        set_cache_headers(response, cache_status, age)
         return {
             "status": "success",
             "config_test": "passed",
@@ -264,6 +890,8 @@ async def test_configuration():
             "flow_id": FLOW_ID,
             "test_response": test_response
         }
+    except ClientDisconnected:
+        raise
     except Exception as e:
         logger.error(f"Configuration test failed: {str(e)}")
         return {
@@ -276,6 +904,8 @@ async def test_configuration():
 
 class GeminiRequest(BaseModel):
     message: str
+    full_scan: bool = False  # Analyze every record instead of the most relevant ones
+    stream: bool = False  # Stream Server-Sent Events instead of one JSON response
     
     class Config:
         json_schema_extra = {
@@ -284,40 +914,59 @@ class GeminiRequest(BaseModel):
             }
         }
 
+async def stream_analysis(message: str, full_scan: bool):
+    """
+    Stream /analysis as SSE: a 'visualization' event, one 'chunk' event per
+    analyzed chunk, 'token' events for the merged answer and a final 'done'
+    event carrying the same fields as the non-streaming response.
+    """
+    visualization_data = build_visualization(get_engine(), message)
+    yield sse_event("visualization", visualization_data)
+
+    parts = []
+    try:
+        async for event, payload in stream_prompt_with_data(message, full_scan):
+            if event == "token":
+                parts.append(payload["text"])
+            yield sse_event(event, payload)
+    except Exception as e:
+        logger.error(f"Analysis stream failed: {str(e)}")
+        yield sse_event("error", {"status": "error", "detail": f"Analysis failed: {str(e)}"})
+        return
+
+    yield sse_event("done", {
+        "status": "success",
+        "analysis": "".join(parts),
+        "visualization": visualization_data
+    })
+
 @app.post("/analysis")
-async def analyze_message(request: Request):
+async def analyze_message(request: GeminiRequest, http_request: Request):
     try:
-        data = await request.json()
-        message = data.get("message")
+        message = request.message
+        full_scan = request.full_scan
+
+        wants_stream = request.stream or "text/event-stream" in http_request.headers.get("accept", "")
+        if wants_stream:
+            return StreamingResponse(
+                stream_analysis(message, full_scan),
+                media_type="text/event-stream",
+                headers=SSE_HEADERS
+            )
         
         # Use the existing handle_prompt function
-        analysis_text = await handle_prompt(message)
+        analysis_text = await run_until_disconnected(http_request, handle_prompt(message, full_scan=full_scan))
         
-        # Add visualization data based on the analysis
-        visualization_data = {
-            "labels": ["Image Posts", "Text Posts", "Video Posts"],
-            "datasets": [{
-                "label": 'Average Engagement',
-                "data": [1200, 400, 800],  # Example values
-                "backgroundColor": [
-                    'rgba(75, 192, 192, 0.6)',
-                    'rgba(255, 99, 132, 0.6)',
-                    'rgba(255, 206, 86, 0.6)',
-                ],
-                "borderColor": [
-                    'rgba(75, 192, 192, 1)',
-                    'rgba(255, 99, 132, 1)',
-                    'rgba(255, 206, 86, 1)',
-                ],
-                "borderWidth": 1
-            }]
-        }
+        # Chart the real aggregates along the dimension the question asks about
+        visualization_data = build_visualization(get_engine(), message)
         
         return {
             "status": "success",
             "analysis": analysis_text,
             "visualization": visualization_data
         }
+    except (ClientDisconnected, CircuitOpenError):
+        raise
     except Exception as e:
         logger.error(f"Analysis failed: {str(e)}")
         raise HTTPException(
@@ -0,0 +1,291 @@
+import asyncio
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, wide enough for Apify runs that take minutes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+Sample = Tuple[Dict[str, str], float]
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class Metric:
+    """Base class for labelled metrics; samples are keyed by label values in label_names order"""
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.label_names, key))
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        super().__init__(name, help, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, self._labels(key), value
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        super().__init__(name, help, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, self._labels(key), value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the block, including awaits inside it"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+class Registry:
+    """
+    Process-wide set of metrics rendered in the Prometheus text format.
+
+    Collectors are callables run at scrape time for values that already live
+    elsewhere (cache counters, breaker states); they return
+    (name, kind, help, [(labels, value), ...]) tuples.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]) -> None:
+        with self._lock:
+            self._collectors.append(collector)
+
+    def counter(self, name: str, help: str, label_names: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, label_names))
+
+    def gauge(self, name: str, help: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, label_names))
+
+    def histogram(self, name: str, help: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, label_names, buckets))
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                print(f"❌ Metrics collector failed: {str(e)}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by endpoint and status", ("method", "path", "status"))
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Time from request to the last byte of the response", ("method", "path"))
+http_in_flight = registry.gauge(
+    "http_requests_in_flight", "HTTP requests being served")
+
+stage_duration = registry.histogram(
+    "stage_duration_seconds", "Duration of pipeline stages (Apify, Astra, Gemini, Langflow)", ("stage",))
+stage_errors = registry.counter(
+    "stage_errors_total", "Pipeline stages that raised an error", ("stage",))
+stage_in_flight = registry.gauge(
+    "stage_in_flight", "Pipeline stages currently running", ("stage",))
+
+@contextmanager
+def track_stage(stage: str):
+    """Time a pipeline stage and count it as in flight and, if it raises, as failed"""
+    start = time.perf_counter()
+    stage_in_flight.inc(stage=stage)
+    try:
+        yield
+    except BaseException as e:
+        # A cancelled request or a closed stream is not a failure of the stage
+        if not isinstance(e, (asyncio.CancelledError, GeneratorExit)):
+            stage_errors.inc(stage=stage)
+        raise
+    finally:
+        stage_in_flight.dec(stage=stage)
+        stage_duration.observe(time.perf_counter() - start, stage=stage)
+
+def cache_samples(name: str, stats: Dict[str, float]) -> List[Tuple[str, Sample]]:
+    """Turn a cache's stats() dict into (metric name, sample) pairs labelled by cache"""
+    labels = {"cache": name}
+    return [
+        ("cache_hits_total", (labels, stats.get("hits", 0) + stats.get("stale_hits", 0))),
+        ("cache_misses_total", (labels, stats.get("misses", 0))),
+        ("cache_hit_ratio", (labels, stats.get("hit_ratio", 0.0))),
+        ("cache_entries", (labels, stats.get("size", 0))),
+    ]
+
+CACHE_FAMILIES = {
+    "cache_hits_total": ("counter", "Cache lookups answered from the cache (fresh or stale)"),
+    "cache_misses_total": ("counter", "Cache lookups that missed"),
+    "cache_hit_ratio": ("gauge", "Share of cache lookups answered from the cache"),
+    "cache_entries": ("gauge", "Entries currently held in memory"),
+}
+
+def register_caches(caches: Callable[[], Dict[str, Dict[str, float]]]) -> None:
+    """Export hit/miss counters, hit ratio and size of caches given as {name: stats()}"""
+    def collect():
+        families: Dict[str, List[Sample]] = {name: [] for name in CACHE_FAMILIES}
+        for cache_name, stats in caches().items():
+            for name, sample in cache_samples(cache_name, stats):
+                families[name].append(sample)
+        return [(name, kind, help, families[name]) for name, (kind, help) in CACHE_FAMILIES.items()]
+
+    registry.register_collector(collect)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request counts, latency and in-flight requests.
+
+    Requests are labelled with the matched route's path template, so path
+    parameters don't explode the label space. Latency runs until the last
+    body chunk is sent, which makes streamed (SSE) responses count in full.
+    """
+
+    def __init__(self, app, exclude: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        state = {"status": 500, "recorded": False}
+        http_in_flight.inc()
+
+        def record():
+            if state["recorded"]:
+                return
+            state["recorded"] = True
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            http_requests.inc(method=method, path=path, status=str(state["status"]))
+            http_request_duration.observe(time.perf_counter() - start, method=method, path=path)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Also covers responses cut short by errors or client disconnects
+            record()
+            http_in_flight.dec()
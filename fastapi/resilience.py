@@ -0,0 +1,295 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import contextvars
+import aiohttp
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# HTTP statuses worth retrying: throttling and transient server-side failures
+RETRYABLE_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class UpstreamError(Exception):
+    """An upstream dependency failed after retries"""
+
+    def __init__(self, upstream: str, message: str, transient: bool = False):
+        super().__init__(f"{upstream}: {message}")
+        self.upstream = upstream
+        self.transient = transient
+
+class CircuitOpenError(UpstreamError):
+    """Raised without calling the upstream while its circuit breaker is open"""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(upstream, f"temporarily unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+def is_transient(exc: BaseException) -> bool:
+    """Whether an error is likely to go away on retry (timeouts, resets, 429/5xx)"""
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError, aiohttp.ClientConnectionError)):
+        return True
+    if isinstance(exc, UpstreamError):
+        return exc.transient
+    # aiohttp uses .status, the Apify client .status_code and google-api-core .code
+    for attr in ("status", "status_code", "code"):
+        status = getattr(exc, attr, None)
+        if isinstance(status, int):
+            return status in RETRYABLE_STATUSES
+    return False
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After failure_threshold transient failures in a row the circuit opens and
+    calls fail fast for reset_timeout seconds. Then a single probe call is let
+    through (half-open): success closes the circuit, failure reopens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> Optional[float]:
+        """Return None if a call may proceed, else seconds until the next probe"""
+        if self.failure_threshold <= 0:
+            return None
+        with self._lock:
+            if self.state == CLOSED:
+                return None
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == OPEN and remaining <= 0:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return None
+            return max(remaining, 1.0)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                if self.state == CLOSED:
+                    print(f"🔌 {self.name} circuit opened after {self.failures} consecutive failures")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+
+    def release(self) -> None:
+        # A probe that ended without a verdict (e.g. cancelled) frees the probe slot
+        with self._lock:
+            self._probing = False
+
+# Extra threads for hedged attempts of blocking calls, so they never wait behind the caller's pool
+HEDGE_MAX_WORKERS = int(os.getenv("HEDGE_MAX_WORKERS", 8))
+# Created on first use so a later lifespan in the same process gets a fresh pool after shutdown()
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_hedge_executor_lock = threading.Lock()
+
+def get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix="hedge")
+        return _hedge_executor
+
+_upstreams: Dict[str, "Upstream"] = {}
+
+class Upstream:
+    """
+    Retry, hedging and circuit-breaking policy for one upstream dependency.
+
+    Transient failures are retried with full-jitter exponential backoff. If
+    hedge_after is set, an attempt still running after that many seconds gets
+    a duplicate and the first to succeed wins. Every attempt passes the
+    upstream's circuit breaker, so an outage fails fast instead of piling up
+    timeouts. Errors that are not transient are raised at once.
+    """
+
+    def __init__(self, name: str, attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8,
+                 hedge_after: float = 0, failure_threshold: int = 5, reset_timeout: float = 30,
+                 retryable: Callable[[BaseException], bool] = is_transient):
+        self.name = name
+        self.attempts = max(attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_after = hedge_after
+        self.retryable = retryable
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.retries = 0
+        self.hedges = 0
+        self.failures = 0
+        _upstreams[name] = self
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str, **defaults) -> "Upstream":
+        """Build an upstream whose settings can be overridden by <prefix>_* variables"""
+        def setting(suffix, key, cast):
+            value = os.getenv(f"{prefix}_{suffix}")
+            default = defaults.pop(key, None)
+            return cast(value) if value is not None else default
+
+        options = {
+            "attempts": setting("RETRY_ATTEMPTS", "attempts", int),
+            "base_delay": setting("RETRY_BASE_DELAY", "base_delay", float),
+            "hedge_after": setting("HEDGE_AFTER_SECS", "hedge_after", float),
+            "failure_threshold": setting("BREAKER_THRESHOLD", "failure_threshold", int),
+            "reset_timeout": setting("BREAKER_RESET_SECS", "reset_timeout", float),
+        }
+        options = {key: value for key, value in options.items() if value is not None}
+        return cls(name, **options, **defaults)
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter: uniform in [0, min(max_delay, base * 2^attempt)]
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _check_breaker(self) -> None:
+        retry_after = self.breaker.allow()
+        if retry_after is not None:
+            raise CircuitOpenError(self.name, retry_after)
+
+    def _record(self, exc: Optional[BaseException]) -> None:
+        if exc is None:
+            self.breaker.record_success()
+        elif self.retryable(exc):
+            self.breaker.record_failure()
+        else:
+            # Bad requests and local errors say nothing about the upstream's health
+            self.breaker.release()
+
+    def _give_up(self, exc: BaseException, attempt: int) -> bool:
+        self.failures += 1
+        if not self.retryable(exc) or attempt + 1 >= self.attempts:
+            return True
+        self.retries += 1
+        print(f"🔁 {self.name} attempt {attempt + 1} failed ({type(exc).__name__}: {exc}), retrying")
+        return False
+
+    async def call(self, fn: Callable[[], Awaitable]):
+        """Await fn() under this upstream's policy; fn must start a fresh attempt each call"""
+        for attempt in range(self.attempts):
+            self._check_breaker()
+            try:
+                result = await self._hedged(fn)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                self._record(e)
+                if self._give_up(e, attempt):
+                    raise
+                await asyncio.sleep(self.backoff(attempt))
+                continue
+            self._record(None)
+            return result
+
+    async def _hedged(self, fn: Callable[[], Awaitable]):
+        if not self.hedge_after:
+            return await fn()
+
+        tasks = {asyncio.ensure_future(fn())}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if not done:
+                self.hedges += 1
+                tasks.add(asyncio.ensure_future(fn()))
+            pending, error = tasks, None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Losing or abandoned attempts are cancelled (Apify runs abort themselves)
+            for task in tasks:
+                task.cancel()
+
+    def call_sync(self, fn: Callable[[], object], cancel_event: Optional[threading.Event] = None):
+        """Blocking counterpart of call() for worker threads; backoff ends early if cancel_event is set"""
+        for attempt in range(self.attempts):
+            self._check_breaker()
+            try:
+                result = self._hedged_sync(fn)
+            except Exception as e:
+                self._record(e)
+                if self._give_up(e, attempt):
+                    raise
+                if cancel_event is not None:
+                    cancel_event.wait(self.backoff(attempt))
+                else:
+                    time.sleep(self.backoff(attempt))
+                continue
+            except BaseException:
+                self.breaker.release()
+                raise
+            self._record(None)
+            return result
+
+    def _hedged_sync(self, fn: Callable[[], object]):
+        if not self.hedge_after:
+            return fn()
+
+        # Hedge threads inherit the caller's context (e.g. its cancellation flag)
+        executor = get_hedge_executor()
+        futures = {executor.submit(contextvars.copy_context().run, fn)}
+        done, _ = wait(futures, timeout=self.hedge_after)
+        if not done:
+            self.hedges += 1
+            futures.add(executor.submit(contextvars.copy_context().run, fn))
+        pending, error = futures, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "times_opened": self.breaker.times_opened,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "failures": self.failures
+        }
+
+def upstream_stats() -> Dict[str, dict]:
+    """Policy counters and breaker state of every upstream"""
+    return {name: upstream.stats() for name, upstream in _upstreams.items()}
+
+def open_circuits() -> List[str]:
+    return [name for name, upstream in _upstreams.items() if upstream.breaker.state != CLOSED]
+
+def shutdown():
+    # Stops the hedge pool when the app shuts down; the next hedged call starts a new one
+    global _hedge_executor
+    with _hedge_executor_lock:
+        executor, _hedge_executor = _hedge_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
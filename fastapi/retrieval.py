@@ -0,0 +1,91 @@
+import math
+import re
+import numpy as np
+from collections import Counter, defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+# Free-text fields of data.json that questions are matched against
+TEXT_FIELDS = (
+    "Username", "Platform", "Post_Text", "Hashtags", "Mentions", "Media_Type",
+    "Location", "User_Activity", "User_Bio", "User_Description_1",
+    "User_Description_2", "Server_Post", "User_Language"
+)
+
+STOPWORDS = frozenset("""
+a about all an and any are as at be by can do does for from how i in is it its me my
+of on or our post posts should show tell that the their them these this to was what
+when where which who why will with you your none
+""".split())
+
+# Words about metrics rather than content; every record is equally relevant to them
+METRIC_WORDS = frozenset("""
+analysis analyze account accounts across average best compare comments content data
+engagement followers following give growth improve insight insights interactions likes
+main most overall pattern patterns perform performance performing reach recommend shares
+social media top trend trends user users worst
+""".split())
+
+IGNORED_TERMS = STOPWORDS | METRIC_WORDS
+
+CAMEL_RE = re.compile(r"([a-z])([A-Z])")
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> List[str]:
+    # Splits camelCase hashtags and handles ("#FoodieTravels" -> foodie, travels)
+    text = CAMEL_RE.sub(r"\1 \2", text or "").lower()
+    return [token for token in TOKEN_RE.findall(text) if token not in IGNORED_TERMS]
+
+class BM25Index:
+    """
+    In-memory inverted index with Okapi BM25 scoring over a fixed record set.
+
+    Terms that occur in more than max_df of the records (e.g. "english" in a
+    mostly English dataset) are not selective; a query made only of such
+    terms returns no hits, so callers fall back to scanning everything.
+    """
+
+    def __init__(self, records: Sequence[Dict], fields: Sequence[str] = TEXT_FIELDS,
+                 k1: float = 1.5, b: float = 0.75, max_df: float = 0.5):
+        self.records = records
+        self.k1 = k1
+        self.b = b
+        self.size = len(records)
+        self.max_df = max_df
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+
+        lengths = []
+        for doc_id, record in enumerate(records):
+            tokens = tokenize(" ".join(str(record.get(field) or "") for field in fields))
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.postings[term].append((doc_id, tf))
+
+        self.doc_len = np.array(lengths, dtype=np.float64)
+        self.avg_len = float(self.doc_len.mean()) if self.size else 0.0
+        self.idf = {
+            term: math.log(1 + (self.size - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
+        """Return up to top_k (record index, score) pairs, best first"""
+        scores = np.zeros(self.size, dtype=np.float64)
+        matched = False
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs or len(docs) > self.max_df * self.size:
+                continue
+            matched = True
+            ids = np.fromiter((doc_id for doc_id, _ in docs), dtype=np.int64, count=len(docs))
+            tf = np.fromiter((count for _, count in docs), dtype=np.float64, count=len(docs))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[ids] / max(self.avg_len, 1e-9))
+            scores[ids] += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+
+        if not matched:
+            return []
+        candidates = np.flatnonzero(scores > 0)
+        best = candidates[np.argsort(-scores[candidates], kind="stable")][:top_k]
+        return [(int(i), float(scores[i])) for i in best]
+
+    def top_records(self, query: str, top_k: int = 10) -> List[Dict]:
+        return [self.records[i] for i, _ in self.search(query, top_k)]
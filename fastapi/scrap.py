@@ -1,89 +1,169 @@
-from apify_client import ApifyClient
+from apify_client import ApifyClientAsync
 from urllib.parse import urlparse
-from datetime import datetime, timedelta
+from datetime import datetime
 import asyncio
+import time
 import aiohttp
-from functools import lru_cache
-from vectorStaxConnect import db  # Import the database connection from vectorStaxConnect
+from cache import TTLCache, HIT, STALE
+from resilience import Upstream, UpstreamError, CircuitOpenError
+from metrics import track_stage
+from tracing import traced, annotate
+from vectorStaxConnect import get_async_collection  # Lazily created, reused collection handle
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
-# Initialize the ApifyClient with your API token
-apify_client = ApifyClient(os.getenv("APIFY_API_TOKEN"))
+# Retries the Apify client makes on its own; kept small since the policies below retry too
+APIFY_CLIENT_MAX_RETRIES = int(os.getenv("APIFY_CLIENT_MAX_RETRIES", 1))
+
+# Initialize the async ApifyClient with your API token (APIFY_API_URL points it elsewhere, e.g. a local stand-in)
+apify_client = ApifyClientAsync(
+    os.getenv("APIFY_API_TOKEN"),
+    api_url=os.getenv("APIFY_API_URL") or None,
+    max_retries=APIFY_CLIENT_MAX_RETRIES
+)
+
+APIFY_ACTOR_ID = 'apify/instagram-scraper'
+APIFY_RUN_TIMEOUT_SECS = int(os.getenv("APIFY_RUN_TIMEOUT_SECS", 100))
+# Server-side long-poll window used while waiting for a run to finish
+APIFY_POLL_SECS = int(os.getenv("APIFY_POLL_SECS", 30))
+# Process-wide cap on actor runs in progress at once
+APIFY_MAX_CONCURRENT_RUNS = int(os.getenv("APIFY_MAX_CONCURRENT_RUNS", 8))
+ACTOR_TERMINAL_STATUSES = {'SUCCEEDED', 'FAILED', 'TIMED-OUT', 'ABORTED'}
+# Usernames sent to the actor in one multi-URL run by batch scrapes, and those runs' timeout
+APIFY_BATCH_SIZE = int(os.getenv("APIFY_BATCH_SIZE", 50))
+APIFY_BATCH_RUN_TIMEOUT_SECS = int(os.getenv("APIFY_BATCH_RUN_TIMEOUT_SECS", 900))
+# Document upserts in flight at once when batch scrapes store their results
+ASTRA_BULK_WRITE_CONCURRENCY = int(os.getenv("ASTRA_BULK_WRITE_CONCURRENCY", 16))
+# Largest results_limit served from the profile's latestPosts (the details result carries up to 12),
+# saving the separate posts run; 0 always runs the posts actor
+APIFY_SINGLE_RUN_MAX_POSTS = int(os.getenv("APIFY_SINGLE_RUN_MAX_POSTS", 12))
+
+actor_run_slots = asyncio.Semaphore(APIFY_MAX_CONCURRENT_RUNS)
+# Retry/backoff, optional hedging and circuit breaking for actor runs (APIFY_RETRY_* etc.);
+# a retry starts a new run, so only start failures and runs that FAILED or TIMED-OUT get one
+apify_upstream = Upstream.from_env("apify", "APIFY", attempts=2, base_delay=2)
+# Policy for polling a started run and reading its dataset, retried against that same run (APIFY_API_RETRY_* etc.)
+apify_api_upstream = Upstream.from_env("apify_api", "APIFY_API", attempts=4, base_delay=1)
+
+# Reuse stored posts and fetch only newer ones when a snapshot exists
+INCREMENTAL_SCRAPE = os.getenv("INCREMENTAL_SCRAPE", "true").lower() == "true"
+
+# Profile cache keyed on (username, results_limit, incremental)
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 100))
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", 3600))
+# How long an expired entry may still be served while it is refreshed in the background
+PROFILE_CACHE_STALE_TTL = int(os.getenv("PROFILE_CACHE_STALE_TTL", 86400))
+PROFILE_CACHE_SWR = os.getenv("PROFILE_CACHE_SWR", "true").lower() == "true"
+
+profile_cache = TTLCache(
+    maxsize=PROFILE_CACHE_SIZE,
+    ttl=PROFILE_CACHE_TTL,
+    stale_ttl=PROFILE_CACHE_STALE_TTL if PROFILE_CACHE_SWR else 0
+)
+
+# Scrapes currently running, keyed like the cache, so concurrent callers share one
+_inflight_scrapes = {}
+# Number of callers awaiting each in-flight scrape; the last one leaving cancels it
+_scrape_waiters = {}
+
+def normalize_username(username):
+    """Canonical form the actor reports and documents are stored under: no whitespace or '@', lowercase"""
+    return username.strip().lstrip('@').lower()
+
+def profile_cache_key(username, results_limit, incremental=None):
+    # Incremental scrapes may reuse stored posts, so they don't answer requests for a full scrape
+    if incremental is None:
+        incremental = INCREMENTAL_SCRAPE
+    return (normalize_username(username), int(results_limit), bool(incremental))
+
+def cache_profile_result(username, results_limit, incremental, result):
+    """Cache a successful scrape; a full scrape also answers incremental requests"""
+    key = profile_cache_key(username, results_limit, incremental)
+    profile_cache.set(key, result)
+    if not key[2]:
+        profile_cache.set(key[:2] + (True,), result)
+
+async def run_actor(apify_client, input_data, timeout_secs=APIFY_RUN_TIMEOUT_SECS):
+    """Run the actor under the Apify retry and circuit-breaker policy and return its dataset items"""
+    return await apify_upstream.call(lambda: run_actor_once(apify_client, input_data, timeout_secs))
+
+@traced("apify_actor_run")
+async def run_actor_once(apify_client, input_data, timeout_secs=APIFY_RUN_TIMEOUT_SECS):
+    """Start an actor run, wait for it without blocking and return its dataset items"""
+    queued_at = time.perf_counter()
+    async with actor_run_slots:
+        annotate(results_type=input_data.get("resultsType"),
+                 urls=len(input_data.get("directUrls", [])),
+                 queued_ms=round((time.perf_counter() - queued_at) * 1000, 1))
+        run = await apify_client.actor(APIFY_ACTOR_ID).start(
+            run_input=input_data,
+            timeout_secs=timeout_secs
+        )
+        run_id = run['id']
+        run_client = apify_client.run(run_id)
+        annotate(run_id=run_id)
+        try:
+            while run['status'] not in ACTOR_TERMINAL_STATUSES:
+                run = await apify_api_upstream.call(lambda: run_client.wait_for_finish(wait_secs=APIFY_POLL_SECS))
+                if run is None:
+                    raise Exception("Actor run disappeared before finishing")
+        except asyncio.CancelledError:
+            # Nobody is waiting for this run any more, so stop paying for it
+            await abort_run(run_client, run_id)
+            raise
+        except Exception as e:
+            # We can't follow the run any more; stop it rather than leave it billing behind a new attempt
+            await abort_run(run_client, run_id)
+            raise run_lost(run_id, e)
 
-# Add cache for profile data (stores results for 1 hour)
-@lru_cache(maxsize=100)
-def get_cached_profile(username):
-    return None  # Initially None, will be populated on first fetch
+    try:
+        dataset = await apify_api_upstream.call(lambda: apify_client.dataset(run['defaultDatasetId']).list_items())
+    except Exception as e:
+        raise run_lost(run_id, e)
+    annotate(status=run['status'], items=len(dataset.items))
+    if run['status'] != 'SUCCEEDED':
+        if not dataset.items:
+            # Failed and timed-out runs are worth another try; aborted ones were stopped on purpose
+            raise UpstreamError(
+                "apify",
+                f"actor run {run_id} finished with status {run['status']}",
+                transient=run['status'] != 'ABORTED'
+            )
+        print(f"⚠️ Actor run {run_id} finished with status {run['status']}, using its partial results")
+    return dataset.items
+
+async def abort_run(run_client, run_id):
+    print(f"🛑 Aborting actor run {run_id}")
+    try:
+        await run_client.abort()
+    except Exception as e:
+        print(f"❌ Error aborting actor run: {str(e)}")
 
-def is_cache_valid(username):
-    """Check if we have valid cached data"""
-    cached_data = get_cached_profile(username)
-    if cached_data:
-        cache_time = cached_data.get('cache_time')
-        if cache_time and (datetime.now() - cache_time) < timedelta(hours=1):
-            return True
-    return False
+def run_lost(run_id, error):
+    """Error for a started run whose status or results couldn't be read; not worth a new run"""
+    if isinstance(error, CircuitOpenError):
+        return error
+    return UpstreamError("apify", f"lost track of actor run {run_id}: {str(error)}")
 
-async def fetch_profile_data(apify_client, input_data):
+@traced()
+async def fetch_profile_data(apify_client, input_data, timeout_secs=APIFY_RUN_TIMEOUT_SECS):
     """Fetch profile data asynchronously"""
-    actor_call = apify_client.actor('apify/instagram-scraper').call(
-        run_input=input_data,
-        timeout_secs=100  # Reduced timeout
-    )
-    return apify_client.dataset(actor_call['defaultDatasetId']).list_items().items
+    with track_stage("apify_profile"):
+        return await run_actor(apify_client, input_data, timeout_secs)
 
-async def fetch_posts_data(apify_client, input_data):
+@traced()
+async def fetch_posts_data(apify_client, input_data, timeout_secs=APIFY_RUN_TIMEOUT_SECS):
     """Fetch posts data asynchronously"""
-    actor_call = apify_client.actor('apify/instagram-scraper').call(
-        run_input=input_data,
-        timeout_secs=100  # Reduced timeout
-    )
-    return apify_client.dataset(actor_call['defaultDatasetId']).list_items().items
+    with track_stage("apify_posts"):
+        return await run_actor(apify_client, input_data, timeout_secs)
 
 def get_instagram_username(url):
     parsed_url = urlparse(url)
     username = parsed_url.path.strip('/').split('/')[0]
     return username
 
-def delete_user_data(username):
-    """Delete all data for a specific username"""
-    try:
-        instagram_collection = db.get_collection("instagram_data")
-        instagram_collection.delete_many({"username": username})
-        print(f"🗑️ Deleted previous data for username: {username}")
-    except Exception as e:
-        print(f"❌ Error deleting user data: {str(e)}")
-
-def insert_post_to_astra(post_data):
-    """Insert post data into Astra DB with status"""
-    try:
-        instagram_collection = db.get_collection("instagram_data")
-        # Add a type field to identify this as a post
-        post_data['data_type'] = 'post'
-        instagram_collection.insert_one(post_data)
-        return True, "Post data inserted successfully"
-    except Exception as e:
-        return False, f"Error inserting post data: {str(e)}"
-
-def insert_profile_to_astra(profile_data):
-    """Insert profile data into Astra DB"""
-    try:
-        instagram_collection = db.get_collection("instagram_data")
-        profile_data['data_type'] = 'profile'
-        instagram_collection.delete_many({
-            "username": profile_data['username'],
-            "data_type": "profile"
-        })
-
-        # Insert new profile data
-        instagram_collection.insert_one(profile_data)
-        return True, "Profile data inserted successfully"
-    except Exception as e:
-        return False, f"Error inserting profile data: {str(e)}"
-
 def print_post_details(post_data):
     print("="*50)
     print(f"Post Details:")
@@ -122,83 +202,304 @@ def print_profile_details(profile):
     print(f"🔗 External URL: {profile['external_url']}")
     print(f"💼 Business Category: {profile['business_category']}\n")
 
-def insert_data_to_astra(profile_data, posts_data):
-    """Insert both profile and posts data as a single nested document"""
+def build_profile_document(profile_data, posts_data):
+    """Build the nested document stored per username"""
+    # Create the nested structure with numbered posts
+    numbered_posts = {}
+    for idx, post in enumerate(posts_data, 1):
+        numbered_posts[f"post_{idx}"] = post['post_data']
+
+    return {
+        "username": profile_data['username'],
+        "profile_data": profile_data,
+        "posts": numbered_posts,
+        "last_updated": datetime.now().isoformat()
+    }
+
+@traced()
+async def insert_data_to_astra(profile_data, posts_data):
+    """Upsert profile and posts data as a single nested document keyed by username"""
+    annotate(username=profile_data['username'], posts=len(posts_data))
     try:
-        instagram_collection = db.get_collection("instagram_data")
-        
-        # Create the nested structure with numbered posts
-        numbered_posts = {}
-        for idx, post in enumerate(posts_data, 1):
-            numbered_posts[f"post_{idx}"] = post['post_data']
-        
-        # Create new document
-        document = {
-            "username": profile_data['username'],
-            "profile_data": profile_data,
-            "posts": numbered_posts,
-            "last_updated": datetime.now().isoformat()
-        }
-        
-        # Insert the new nested document
-        insert_result = instagram_collection.insert_one(document)
-        
-        if insert_result.inserted_id:
-            print(f"✅ Successfully inserted new data for {profile_data['username']}")
-            return True, "Data inserted successfully"
-        else:
-            return False, "Failed to insert data"
-            
+        instagram_collection = get_async_collection()
+        document = build_profile_document(profile_data, posts_data)
+
+        # Replace this username's document in place, or create it if it's new
+        with track_stage("astra_write"):
+            previous = await instagram_collection.find_one_and_replace(
+                {"username": document['username']},
+                document,
+                upsert=True
+            )
+
+        action = "updated" if previous else "inserted new"
+        print(f"✅ Successfully {action} data for {profile_data['username']}")
+        return True, "Data inserted successfully"
+
     except Exception as e:
         print(f"❌ Error in insert_data_to_astra: {str(e)}")
+        annotate(error=str(e))
         return False, f"Error inserting data: {str(e)}"
 
-def verify_data_cleanup(username):
-    """Verify that old data has been cleaned up"""
+async def scrape_and_cache_profile(username: str, results_limit: int, incremental: bool = None):
+    """Scrape a profile and store successful results in the cache"""
+    result = await scrape_and_store_profile(username, results_limit, incremental)
+    if result['success']:
+        cache_profile_result(username, results_limit, incremental, result)
+    return result
+
+def start_profile_scrape(username: str, results_limit: int, incremental: bool = None) -> asyncio.Task:
+    """Return the in-flight scrape task for this key, starting one if needed"""
+    key = profile_cache_key(username, results_limit, incremental)
+    task = _inflight_scrapes.get(key)
+    if task is not None:
+        print(f"🔗 Joining in-flight scrape for {username}")
+        return task
+
+    task = asyncio.create_task(scrape_and_cache_profile(username, results_limit, incremental))
+    _inflight_scrapes[key] = task
+
+    def _forget(done_task):
+        if _inflight_scrapes.get(key) is done_task:
+            del _inflight_scrapes[key]
+        if not done_task.cancelled() and done_task.exception() is not None:
+            # Background refreshes have no awaiting caller, so report their failure here
+            print(f"❌ Scrape for {username} failed: {str(done_task.exception())}")
+
+    task.add_done_callback(_forget)
+    return task
+
+@traced()
+async def scrape_instagram_profile(username: str, results_limit: int = 5, use_cache: bool = True,
+                                   incremental: bool = None):
+    """
+    Return profile and posts data, serving it from the profile cache when possible.
+
+    Fresh entries are returned directly. Expired entries inside the stale window
+    are returned at once while a background task refreshes them. Concurrent
+    misses for the same key await a single scrape.
+    """
+    username = normalize_username(username)
+    results_limit = int(results_limit)
+    key = profile_cache_key(username, results_limit, incremental)
+    annotate(username=username, results_limit=results_limit)
+
+    if use_cache:
+        cached_data, status = profile_cache.get_with_status(key)
+        annotate(cache=status)
+        if status == HIT:
+            print("✨ Returning cached data")
+            return dict(cached_data)
+        if status == STALE:
+            print("✨ Returning stale cached data, refreshing in background")
+            if key not in _inflight_scrapes:
+                start_profile_scrape(username, results_limit, incremental)
+            return dict(cached_data)
+
+    # Shield the shared task so one caller going away doesn't cancel it for the others
+    annotate(joined=key in _inflight_scrapes)
+    task = start_profile_scrape(username, results_limit, incremental)
+    _scrape_waiters[key] = _scrape_waiters.get(key, 0) + 1
     try:
-        instagram_collection = db.get_collection("instagram_data")
-        existing_records = instagram_collection.count_documents({
-            "$or": [
-                {"username": username},
-                {"profile_data.username": username},
-                {"posts.username": username}
-            ]
-        })
-        print(f"📊 Found {existing_records} existing records for {username}")
-        return existing_records
+        result = await asyncio.shield(task)
+    except asyncio.CancelledError:
+        if _scrape_waiters.get(key) == 1 and not task.done():
+            # Last interested caller is gone: cancel the scrape and abort its actor runs
+            task.cancel()
+        raise
+    finally:
+        _scrape_waiters[key] -= 1
+        if not _scrape_waiters[key]:
+            del _scrape_waiters[key]
+    return dict(result)
+
+@traced()
+async def load_stored_snapshot(username):
+    """Return the stored document for a username, or None"""
+    try:
+        instagram_collection = get_async_collection()
+        with track_stage("astra_read"):
+            return await instagram_collection.find_one({"username": username})
     except Exception as e:
-        print(f"❌ Error verifying cleanup: {str(e)}")
+        print(f"❌ Error loading stored data: {str(e)}")
         return None
 
-def clear_all_instagram_data():
-    """Clear all data from the instagram_data collection"""
-    try:
-        instagram_collection = db.get_collection("instagram_data")
-        delete_result = instagram_collection.delete_many({})  # Empty filter means delete all
-        print(f"🗑️ Cleared entire collection. Deleted {delete_result.deleted_count} documents")
-        return True
-    except Exception as e:
-        print(f"❌ Error clearing collection: {str(e)}")
-        return False
+def stored_posts_newest_first(snapshot):
+    """Return the post_data dicts of a stored document, newest first"""
+    posts = list((snapshot or {}).get('posts', {}).values())
+    return sorted(posts, key=lambda p: p.get('timestamp', ''), reverse=True)
+
+def actor_base_input(usernames):
+    """Input shared by profile and posts runs: one profile URL per username"""
+    return {
+        "directUrls": [f"https://www.instagram.com/{username}/" for username in usernames],
+        "proxy": {
+            "useApifyProxy": True,
+            "apifyProxyGroups": ["RESIDENTIAL"]
+        },
+        "languageCode": "en"
+    }
+
+def profile_actor_input(usernames):
+    # Profile input configuration
+    return {
+        **actor_base_input(usernames),
+        "resultsType": "details",
+        "searchType": "user",
+    }
+
+def posts_actor_input(usernames, limit, newer_than=None):
+    # Posts input configuration; resultsLimit applies per URL, maxItems to the whole run
+    config = {
+        **actor_base_input(usernames),
+        "resultsType": "posts",
+        "resultsLimit": limit,
+        "maxItems": limit * len(usernames),
+        "searchType": "user",
+        "searchLimit": limit,
+        "scrapeStories": False,
+        "scrapeHighlights": False,
+        "scrapeIgtv": False,
+        "scrapeReels": True,
+        "scrapePosts": True,
+        "scrapeComments": False,
+        "sort": "newest",
+        "limit": limit
+    }
+    if newer_than:
+        config["onlyPostsNewerThan"] = newer_than
+    return config
+
+def build_profile_data(profile_item, username):
+    """Convert a raw actor profile item into the stored profile_data shape"""
+    return {
+        'username': profile_item.get('username', username),
+        'full_name': profile_item.get('fullName', ''),
+        'biography': profile_item.get('biography', ''),
+        'followers_count': profile_item.get('followersCount', 0),
+        'following_count': profile_item.get('followsCount', 0),
+        'is_verified': profile_item.get('verified', False),
+        'profile_pic_url': profile_item.get('profilePicUrl', ''),
+        'profile_url': f"https://www.instagram.com/{username}/",
+        'external_url': profile_item.get('externalUrl', ''),
+        'business_category': profile_item.get('businessCategoryName', ''),
+        'total_posts': profile_item.get('postsCount', 0)
+    }
+
+def number_posts(posts):
+    """Wrap post_data dicts, newest first, in the posts_data entries of a scrape result"""
+    posts_data = []
+    for idx, post_data in enumerate(posts, 1):
+        post_data = {**post_data, 'post_number': f"post_{idx}"}  # Add post number
+        posts_data.append({
+            'post_id': post_data['post_id'],
+            'post_data': post_data,
+            'post_number': f"post_{idx}",  # Add post number to response
+            'db_insert_status': True,
+            'insert_message': 'Post data ready'
+        })
+    return posts_data
+
+def build_post_data(item, username):
+    """Convert a raw actor post item into the stored post_data shape"""
+    video_duration = int(round(item.get('videoDuration', 0))) if isinstance(item.get('videoDuration'), float) else 0
+
+    return {
+        'username': username,
+        'post_id': item.get('id', 'unknown'),
+        'post_type': item.get('type', 'unknown'),
+        'likes': item.get('likesCount', 0),
+        'comments': item.get('commentsCount', 0),
+        'shares': item.get('sharesCount', 0),
+        'timestamp': item.get('timestamp', 'unknown'),
+        'profile_url': item.get('url', ''),
+        'caption': item.get('caption', ''),
+        'video_views': item.get('videoViewCount', 0) if item.get('type', '').lower() == 'video' else 0,
+        'video_duration': video_duration if item.get('type', '').lower() == 'video' else 0
+    }
+
+def merge_posts(new_posts, stored_posts, results_limit):
+    """Merge fresh and stored post_data, newest first, without duplicates"""
+    merged = {}
+    for post in list(new_posts) + list(stored_posts):
+        merged.setdefault(post['post_id'], post)
+    posts = sorted(merged.values(), key=lambda p: p.get('timestamp', ''), reverse=True)
+    return posts[:results_limit]
+
+def plan_posts_fetch(snapshot, profile_item, results_limit):
+    """
+    Decide how many posts to fetch given the stored snapshot and fresh profile.
+
+    Returns 0 when the stored posts are still current, the number of new posts
+    when only a small delta is missing, or None when a full fetch is needed.
+    """
+    stored_posts = stored_posts_newest_first(snapshot)
+    if len(stored_posts) < results_limit:
+        return None
+
+    stored_count = snapshot.get('profile_data', {}).get('total_posts')
+    current_count = profile_item.get('postsCount')
+    if stored_count is None or current_count is None:
+        return None
+
+    newest_stored = stored_posts[0].get('timestamp', '')
+    latest_posts = profile_item.get('latestPosts') or []
+    newest_seen = max((p.get('timestamp') or '' for p in latest_posts), default='')
+
+    delta = current_count - stored_count
+    if delta == 0 and newest_seen <= newest_stored:
+        return 0
+    if 0 < delta < results_limit:
+        return delta
+    return None
 
-async def scrape_instagram_profile(username: str, results_limit: int = 5):
+def posts_from_details(profile_item, results_limit):
+    """
+    Return the newest results_limit raw posts from a profile's latestPosts, or None.
+
+    None means the details result can't stand in for a posts run: the limit is
+    above APIFY_SINGLE_RUN_MAX_POSTS, or the profile has more posts than
+    latestPosts holds and fewer than results_limit of them came back.
+    """
+    if results_limit > APIFY_SINGLE_RUN_MAX_POSTS:
+        return None
+    latest_posts = [p for p in profile_item.get('latestPosts') or [] if 'error' not in p]
+    latest_posts.sort(key=lambda p: p.get('timestamp') or '', reverse=True)
+    posts_count = profile_item.get('postsCount')
+    if len(latest_posts) >= results_limit or (posts_count is not None and len(latest_posts) >= posts_count):
+        return latest_posts[:results_limit]
+    return None
+
+def first_profile_item(profile_items):
+    """Return the profile item of a single-profile run, raising if the run found none"""
+    if not profile_items:
+        raise Exception("No profile data found")
+    profile_item = profile_items[0]
+    if 'error' in profile_item:
+        raise Exception("Error in profile data")
+    return profile_item
+
+@traced()
+async def scrape_and_store_profile(username: str, results_limit: int = 5, incremental: bool = None):
     """
     Optimized Instagram profile and posts scraping
+
+    In incremental mode the stored snapshot for the username decides whether the
+    posts actor runs at all, or only fetches posts newer than the stored ones.
+    Limits up to APIFY_SINGLE_RUN_MAX_POSTS are served from the profile's
+    latestPosts in a single actor run, falling back to a posts run only when
+    those don't cover the limit.
     """
     try:
+        # Stored documents are keyed on the canonical username, so '@Nike' must look up 'nike'
+        username = normalize_username(username)
         results_limit = int(results_limit)
+        if incremental is None:
+            incremental = INCREMENTAL_SCRAPE
+        annotate(username=username, incremental=incremental)
         print(f"🎯 Requested {results_limit} posts")
 
-        # Clear all existing data from collection first
-        clear_success = clear_all_instagram_data()
-        if not clear_success:
-            print("⚠️ Warning: Failed to clear existing data")
-
-        # Check cache first
-        if is_cache_valid(username):
-            cached_data = get_cached_profile(username)
-            print("✨ Returning cached data")
-            return cached_data
+        snapshot = await load_stored_snapshot(username) if incremental else None
 
         result = {
             'profile_data': None,
@@ -208,118 +509,60 @@ async def scrape_instagram_profile(username: str, results_limit: int = 5):
             'cache_time': datetime.now()
         }
 
-        # Optimize input configuration
-        base_input = {
-            "directUrls": [f"https://www.instagram.com/{username}/"],
-            "proxy": {
-                "useApifyProxy": True,
-                "apifyProxyGroups": ["RESIDENTIAL"]
-            },
-            "languageCode": "en"
-        }
-
-        # Profile input configuration
-        profile_input = {
-            **base_input,
-            "resultsType": "details",
-            "searchType": "user",
-        }
-
-        # Posts input configuration
-        posts_input = {
-            **base_input,
-            "resultsType": "posts",
-            "maxItems": results_limit,
-            "searchType": "user",
-            "searchLimit": results_limit,
-            "scrapeStories": False,
-            "scrapeHighlights": False,
-            "scrapeIgtv": False,
-            "scrapeReels": True,
-            "scrapePosts": True,
-            "scrapeComments": False,
-            "sort": "newest",
-            "limit": results_limit
-        }
-
-        # Run profile and posts fetching in parallel
-        profile_items, posts_items = await asyncio.gather(
-            fetch_profile_data(apify_client, profile_input),
-            fetch_posts_data(apify_client, posts_input)
-        )
-
-        if not profile_items:
-            raise Exception("No profile data found")
-
-        # Process profile data
-        profile_item = profile_items[0]
-        if 'error' in profile_item:
-            raise Exception("Error in profile data")
+        profile_input = profile_actor_input([username])
+
+        def posts_input(limit, newer_than=None):
+            return posts_actor_input([username], limit, newer_than)
+
+        stored_posts = []
+        # With fewer stored posts than requested a full posts fetch is needed whatever the profile says
+        reusable = snapshot is not None and len(stored_posts_newest_first(snapshot)) >= results_limit
+        if snapshot and not reusable:
+            annotate(posts_plan="full")
+        if reusable or results_limit <= APIFY_SINGLE_RUN_MAX_POSTS:
+            # The profile runs first: it decides how many posts are missing and may already hold them
+            profile_item = first_profile_item(await fetch_profile_data(apify_client, profile_input))
+            fetch_count = plan_posts_fetch(snapshot, profile_item, results_limit) if reusable else None
+            if reusable:
+                annotate(posts_plan="full" if fetch_count is None else fetch_count)
+            details_posts = posts_from_details(profile_item, results_limit)
+            if fetch_count == 0:
+                print("♻️ No new posts since last scrape, reusing stored posts")
+                posts_items = []
+                stored_posts = stored_posts_newest_first(snapshot)
+            elif details_posts is not None:
+                print("📎 Using the profile's latest posts, skipping the posts run")
+                annotate(posts_source="details")
+                posts_items = details_posts
+            elif fetch_count:
+                print(f"➕ Fetching {fetch_count} new posts since last scrape")
+                stored_posts = stored_posts_newest_first(snapshot)
+                posts_items = await fetch_posts_data(
+                    apify_client,
+                    posts_input(fetch_count, newer_than=stored_posts[0].get('timestamp'))
+                )
+            else:
+                posts_items = await fetch_posts_data(apify_client, posts_input(results_limit))
+        else:
+            # Run profile and posts fetching in parallel
+            profile_items, posts_items = await asyncio.gather(
+                fetch_profile_data(apify_client, profile_input),
+                fetch_posts_data(apify_client, posts_input(results_limit))
+            )
+            profile_item = first_profile_item(profile_items)
 
         # Process profile data
-        profile_data = {
-            'username': profile_item.get('username', username),
-            'full_name': profile_item.get('fullName', ''),
-            'biography': profile_item.get('biography', ''),
-            'followers_count': profile_item.get('followersCount', 0),
-            'following_count': profile_item.get('followsCount', 0),
-            'is_verified': profile_item.get('verified', False),
-            'profile_pic_url': profile_item.get('profilePicUrl', ''),
-            'profile_url': f"https://www.instagram.com/{username}/",
-            'external_url': profile_item.get('externalUrl', ''),
-            'business_category': profile_item.get('businessCategoryName', ''),
-            'total_posts': profile_item.get('postsCount', 0)
-        }
+        profile_data = build_profile_data(profile_item, username)
 
         result['profile_data'] = profile_data
 
-        # Process posts with optimized sorting
-        posts_items = sorted(
-            posts_items, 
-            key=lambda x: x.get('timestamp', ''), 
-            reverse=True
-        )[:results_limit]  # Limit posts early
-
-        # Process posts data
-        for idx, item in enumerate(posts_items, 1):
-            if 'error' in item:
-                continue
-            
-            video_duration = int(round(item.get('videoDuration', 0))) if isinstance(item.get('videoDuration'), float) else 0
-            
-            post_data = {
-                'post_number': f"post_{idx}",  # Add post number
-                'username': username,
-                'post_id': item.get('id', 'unknown'),
-                'post_type': item.get('type', 'unknown'),
-                'likes': item.get('likesCount', 0),
-                'comments': item.get('commentsCount', 0),
-                'shares': item.get('sharesCount', 0),
-                'timestamp': item.get('timestamp', 'unknown'),
-                'profile_url': item.get('url', ''),
-                'caption': item.get('caption', ''),
-                'video_views': item.get('videoViewCount', 0) if item.get('type', '').lower() == 'video' else 0,
-                'video_duration': video_duration if item.get('type', '').lower() == 'video' else 0
-            }
-            
-            result['posts_data'].append({
-                'post_id': post_data['post_id'],
-                'post_data': post_data,
-                'post_number': f"post_{idx}",  # Add post number to response
-                'db_insert_status': True,
-                'insert_message': 'Post data ready'
-            })
-
-        # Verify and log existing data before deletion
-        existing_count = verify_data_cleanup(username)
-        print(f"🔍 Found {existing_count} existing records before cleanup")
+        # Process posts data and merge in any stored posts being reused
+        new_posts = [build_post_data(item, username) for item in posts_items if 'error' not in item]
+        posts = merge_posts(new_posts, stored_posts, results_limit)
+        result['posts_data'] = number_posts(posts)
 
         # Store both profile and posts data together
-        db_success, db_message = insert_data_to_astra(profile_data, result['posts_data'])
-        
-        # Verify cleanup after insertion
-        final_count = verify_data_cleanup(username)
-        print(f"✅ After insertion: {final_count} record exists")
+        db_success, db_message = await insert_data_to_astra(profile_data, result['posts_data'])
 
         result['db_status'] = db_success
         result['db_message'] = db_message
@@ -327,21 +570,154 @@ async def scrape_instagram_profile(username: str, results_limit: int = 5):
         result['success'] = True
         print(f"✅ Successfully fetched {len(result['posts_data'])} posts")
 
-        # Update cache
-        get_cached_profile.cache_clear()
         result['cache_time'] = datetime.now()
-        get_cached_profile(username)  # Cache the new result
-
         return result
 
+    except CircuitOpenError:
+        # Apify is known to be down; let the caller answer 503 instead of a failed scrape
+        raise
     except Exception as e:
         print(f"❌ Error: {str(e)}")
-        return {
-            'profile_data': None,
-            'posts_data': [],
-            'success': False,
-            'error': f"Failed to process data: {str(e)}"
+        return failed_result(str(e))
+
+def failed_result(error):
+    return {
+        'profile_data': None,
+        'posts_data': [],
+        'success': False,
+        'error': f"Failed to process data: {error}"
+    }
+
+def normalize_usernames(usernames):
+    """Strip '@' and whitespace, lowercase and drop duplicates, keeping the first occurrence"""
+    return list(dict.fromkeys(normalize_username(u) for u in usernames if u and normalize_username(u)))
+
+def item_username(item):
+    # Items of multi-URL runs carry the URL they came from; fall back to the owner the actor reports
+    if item.get('inputUrl'):
+        return get_instagram_username(item['inputUrl']).lower()
+    return (item.get('ownerUsername') or item.get('username') or '').lower()
+
+def group_items_by_username(items):
+    grouped = {}
+    for item in items:
+        grouped.setdefault(item_username(item), []).append(item)
+    return grouped
+
+@traced()
+async def scrape_profile_batch(usernames, results_limit):
+    """
+    Scrape several usernames with one multi-URL profile run and one posts run, split per username.
+
+    Within APIFY_SINGLE_RUN_MAX_POSTS the posts run only covers the usernames
+    whose latestPosts fall short, and is skipped when none do.
+    """
+    annotate(usernames=len(usernames))
+    details_posts = {}
+    if results_limit <= APIFY_SINGLE_RUN_MAX_POSTS:
+        profile_items = await fetch_profile_data(apify_client, profile_actor_input(usernames),
+                                                 APIFY_BATCH_RUN_TIMEOUT_SECS)
+        profiles = group_items_by_username(profile_items)
+        for username in usernames:
+            profile_item = (profiles.get(username) or [None])[0]
+            if profile_item is not None and 'error' not in profile_item:
+                details_posts[username] = posts_from_details(profile_item, results_limit)
+        missing = [username for username, posts in details_posts.items() if posts is None]
+        annotate(posts_from_details=len(details_posts) - len(missing))
+        posts_items = await fetch_posts_data(
+            apify_client, posts_actor_input(missing, results_limit), APIFY_BATCH_RUN_TIMEOUT_SECS
+        ) if missing else []
+    else:
+        profile_items, posts_items = await asyncio.gather(
+            fetch_profile_data(apify_client, profile_actor_input(usernames), APIFY_BATCH_RUN_TIMEOUT_SECS),
+            fetch_posts_data(apify_client, posts_actor_input(usernames, results_limit), APIFY_BATCH_RUN_TIMEOUT_SECS)
+        )
+        profiles = group_items_by_username(profile_items)
+    posts = group_items_by_username(posts_items)
+
+    results = {}
+    for username in usernames:
+        profile_item = (profiles.get(username) or [None])[0]
+        if profile_item is None:
+            results[username] = failed_result("No profile data found")
+            continue
+        if 'error' in profile_item:
+            results[username] = failed_result("Error in profile data")
+            continue
+        raw_posts = details_posts.get(username)
+        if raw_posts is None:
+            raw_posts = posts.get(username, [])
+        new_posts = [build_post_data(item, username) for item in raw_posts if 'error' not in item]
+        results[username] = {
+            'profile_data': build_profile_data(profile_item, username),
+            'posts_data': number_posts(merge_posts(new_posts, [], results_limit)),
+            'success': True,
+            'error': None
         }
+    return results
+
+@traced()
+async def store_profiles_in_bulk(entries):
+    """Upsert many (profile_data, posts_data) pairs over the pooled connection; returns (ok, message) per pair"""
+    annotate(documents=len(entries))
+    # The Data API has no multi-document replace, so upserts run concurrently within a cap
+    write_slots = asyncio.Semaphore(ASTRA_BULK_WRITE_CONCURRENCY)
+
+    async def store(profile_data, posts_data):
+        async with write_slots:
+            return await insert_data_to_astra(profile_data, posts_data)
+
+    return await asyncio.gather(*(store(profile_data, posts_data) for profile_data, posts_data in entries))
+
+@traced()
+async def scrape_and_store_profiles(usernames, results_limit: int = 5):
+    """
+    Scrape many profiles with multi-URL actor runs and store them in bulk.
+
+    Usernames are split into batches of APIFY_BATCH_SIZE, each scraped by a
+    single profile run and at most one posts run, so actor start-up is paid per
+    batch rather than per username. Returns per-username results shaped like
+    scrape_and_store_profile's, which also refresh the profile cache.
+    """
+    results_limit = int(results_limit)
+    usernames = normalize_usernames(usernames)
+    batches = [usernames[i:i + APIFY_BATCH_SIZE] for i in range(0, len(usernames), APIFY_BATCH_SIZE)]
+    annotate(usernames=len(usernames), batches=len(batches))
+    print(f"📦 Scraping {len(usernames)} profiles in {len(batches)} batches")
+
+    outcomes = await asyncio.gather(
+        *(scrape_profile_batch(batch, results_limit) for batch in batches),
+        return_exceptions=True
+    )
+    if outcomes and all(isinstance(outcome, CircuitOpenError) for outcome in outcomes):
+        # Apify is known to be down; let the caller answer 503
+        raise outcomes[0]
+
+    results = {}
+    for batch, outcome in zip(batches, outcomes):
+        if isinstance(outcome, BaseException):
+            print(f"❌ Batch of {len(batch)} profiles failed: {str(outcome)}")
+            results.update({username: failed_result(str(outcome)) for username in batch})
+        else:
+            results.update(outcome)
+
+    scraped = [username for username in usernames if results[username]['success']]
+    statuses = await store_profiles_in_bulk(
+        [(results[username]['profile_data'], results[username]['posts_data']) for username in scraped]
+    )
+    cache_time = datetime.now()
+    for username, (db_success, db_message) in zip(scraped, statuses):
+        result = results[username]
+        result.update(db_status=db_success, db_message=db_message, cache_time=cache_time)
+        cache_profile_result(username, results_limit, False, result)
+
+    print(f"✅ Scraped {len(scraped)} of {len(usernames)} profiles in {len(batches)} batches")
+    return {
+        'results': results,
+        'succeeded': len(scraped),
+        'failed': len(usernames) - len(scraped),
+        'batches': len(batches)
+    }
 
 if __name__ == "__main__":
     
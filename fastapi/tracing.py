@@ -0,0 +1,249 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Record spans at all (the trace ID header is sent either way)
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+# Number of recent traces kept in memory for /debug/traces
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 200))
+# Optional JSONL file every finished span is appended to
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH") or None
+
+TRACE_HEADER = "X-Trace-Id"
+TRACE_ID_RE = re.compile(r"^[0-9a-f]{16,32}$")
+
+class Span:
+    """One timed operation; children point at their parent through parent_id"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "duration", "attributes",
+                 "status", "error", "_perf_start")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self._perf_start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.attributes = dict(attributes)
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self._perf_start
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round((self.duration or 0) * 1000, 3),
+            "attributes": self.attributes,
+            "status": self.status,
+            "error": self.error
+        }
+
+class TraceStore:
+    """
+    Ring buffer of recent traces, optionally mirrored to a JSONL file.
+
+    Spans are added as they finish; when more than max_traces traces are
+    held, the least recently started trace is dropped whole.
+    """
+
+    def __init__(self, max_traces: int = TRACE_BUFFER_SIZE, export_path: Optional[str] = TRACE_EXPORT_PATH):
+        self.max_traces = max_traces
+        self.export_path = export_path
+        self._traces: "OrderedDict[str, List[dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        record = span.to_dict()
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = []
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            spans.append(record)
+            if self.export_path:
+                try:
+                    with open(self.export_path, "a", encoding="utf-8") as file:
+                        file.write(json.dumps(record, default=str) + "\n")
+                except OSError as e:
+                    print(f"❌ Error exporting span: {str(e)}")
+
+    def get(self, trace_id: str) -> Optional[List[dict]]:
+        with self._lock:
+            spans = self._traces.get(trace_id)
+            return list(spans) if spans is not None else None
+
+    def summaries(self, min_duration_ms: float = 0, limit: int = 50) -> List[dict]:
+        """Most recent traces first, with their root span's name and duration"""
+        with self._lock:
+            traces = [(trace_id, list(spans)) for trace_id, spans in reversed(self._traces.items())]
+
+        results = []
+        for trace_id, spans in traces:
+            root = next((s for s in spans if s["parent_id"] is None), None)
+            duration = root["duration_ms"] if root else max(s["duration_ms"] for s in spans)
+            if duration < min_duration_ms:
+                continue
+            results.append({
+                "trace_id": trace_id,
+                "name": root["name"] if root else spans[0]["name"],
+                "start": min(s["start"] for s in spans),
+                "duration_ms": duration,
+                "spans": len(spans),
+                "errors": sum(1 for s in spans if s["status"] == "error"),
+                "complete": root is not None
+            })
+            if len(results) >= limit:
+                break
+        return results
+
+trace_store = TraceStore()
+
+# Span the current code runs under; copied into tasks and, via run_on_pool, worker threads
+current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+def new_trace_id() -> str:
+    return secrets.token_hex(16)
+
+def current_trace_id() -> Optional[str]:
+    parent = current_span.get()
+    return parent.trace_id if parent is not None else None
+
+@contextmanager
+def span(name: str, trace_id: Optional[str] = None, **attributes):
+    """
+    Time the block as a child of the current span, or as a new trace's root.
+
+    Yields the Span so callers can attach attributes found along the way.
+    Exceptions mark the span as failed; cancellation marks it as cancelled.
+    """
+    parent = current_span.get()
+    if parent is not None:
+        trace_id = parent.trace_id
+    current = Span(name, trace_id or new_trace_id(), parent.span_id if parent else None, attributes)
+    token = current_span.set(current)
+    try:
+        yield current
+    except (asyncio.CancelledError, GeneratorExit):
+        current.status = "cancelled"
+        raise
+    except BaseException as e:
+        current.status = "error"
+        current.error = f"{type(e).__name__}: {str(e)}"
+        raise
+    finally:
+        current.finish()
+        try:
+            current_span.reset(token)
+        except ValueError:
+            # Async generators may be finalized from another context
+            pass
+        if TRACING_ENABLED:
+            trace_store.add(current)
+
+def annotate(**attributes) -> None:
+    """Attach attributes to the current span, if any"""
+    current = current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+def traced(name: Optional[str] = None):
+    """Decorator running a sync or async function inside a span named after it"""
+    def decorator(fn):
+        span_name = name or fn.__name__
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def waterfall(spans: List[dict], width: int = 40) -> str:
+    """Render a trace as a text waterfall: offset, duration, a bar and the indented span name"""
+    if not spans:
+        return ""
+    by_parent: Dict[Optional[str], List[dict]] = {}
+    ids = {s["span_id"] for s in spans}
+    for s in sorted(spans, key=lambda s: s["start"]):
+        # Spans whose parent was never recorded are shown at the top level
+        by_parent.setdefault(s["parent_id"] if s["parent_id"] in ids else None, []).append(s)
+
+    origin = min(s["start"] for s in spans)
+    total = max((s["start"] - origin) * 1000 + s["duration_ms"] for s in spans) or 1
+
+    lines = []
+
+    def walk(parent_id, depth):
+        for s in by_parent.get(parent_id, []):
+            offset = (s["start"] - origin) * 1000
+            begin = int(offset / total * width)
+            length = max(int(s["duration_ms"] / total * width), 1)
+            bar = " " * begin + "█" * min(length, width - begin)
+            marker = "" if s["status"] == "ok" else f" [{s['status']}]"
+            attrs = " ".join(f"{k}={v}" for k, v in s["attributes"].items())
+            lines.append(f"{offset:9.1f}ms {s['duration_ms']:9.1f}ms |{bar:<{width}}| "
+                         f"{'  ' * depth}{s['name']}{marker} {attrs}".rstrip())
+            walk(s["span_id"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines) + "\n"
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening a root span per HTTP request.
+
+    The trace ID comes from an incoming X-Trace-Id header when it is valid
+    hex, otherwise a new one is made; either way it is sent back in the
+    X-Trace-Id response header. The root span lasts until the whole response
+    has been sent, so streamed responses are covered in full.
+    """
+
+    def __init__(self, app, exclude: tuple = ("/metrics",)):
+        self.app = app
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude or scope["path"].startswith("/debug/"):
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope.get("headers") or []).get(TRACE_HEADER.lower().encode(), b"").decode().lower()
+        trace_id = incoming if TRACE_ID_RE.match(incoming) else new_trace_id()
+
+        with span(f"{scope.get('method', '')} {scope['path']}", trace_id=trace_id) as root:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    root.set(status=message["status"])
+                    headers = list(message.get("headers", []))
+                    headers.append((TRACE_HEADER.lower().encode(), trace_id.encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
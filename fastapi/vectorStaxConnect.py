@@ -1,24 +1,99 @@
+import asyncio
 from astrapy import DataAPIClient
+from astrapy.api_options import APIOptions, TimeoutOptions
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
-# Initialize the client
-client = DataAPIClient(os.getenv("ASTRAPY_API_TOKEN"))
-db = client.get_database_by_api_endpoint(
-    os.getenv("ASTRAPY_API_ENDPOINT")
-)
+COLLECTION_NAME = "instagram_data"
 
-# Get list of collections
-collections = db.list_collection_names()
-print(f"Available collections: {collections}")
+# Timeouts for Data API calls; each collection object keeps its own keep-alive pool
+ASTRA_REQUEST_TIMEOUT_MS = int(os.getenv("ASTRA_REQUEST_TIMEOUT_MS", 10000))
+ASTRA_METHOD_TIMEOUT_MS = int(os.getenv("ASTRA_METHOD_TIMEOUT_MS", 30000))
 
-instagram_collection = db.get_collection("instagram_data")
-print(f"\nAccessed collection: instagram_data")
+# "prod" for Astra DB; "other" accepts any Data API endpoint (self-hosted or a local stand-in)
+ASTRA_ENVIRONMENT = os.getenv("ASTRA_ENVIRONMENT", "prod")
+ASTRAPY_KEYSPACE = os.getenv("ASTRAPY_KEYSPACE") or None
+
+# Created on first use so importing this module does no network I/O
+_client = None
+_db = None
+_async_db = None
+_collections = {}
+_async_collections = {}
+_warm_up_task = None
+
+def get_client() -> DataAPIClient:
+    """Return the process-wide Data API client"""
+    global _client
+    if _client is None:
+        _client = DataAPIClient(
+            os.getenv("ASTRAPY_API_TOKEN"),
+            environment=ASTRA_ENVIRONMENT,
+            api_options=APIOptions(
+                timeout_options=TimeoutOptions(
+                    request_timeout_ms=ASTRA_REQUEST_TIMEOUT_MS,
+                    general_method_timeout_ms=ASTRA_METHOD_TIMEOUT_MS
+                )
+            )
+        )
+    return _client
+
+def get_db():
+    """Return the process-wide sync database handle"""
+    global _db
+    if _db is None:
+        _db = get_client().get_database_by_api_endpoint(os.getenv("ASTRAPY_API_ENDPOINT"), keyspace=ASTRAPY_KEYSPACE)
+    return _db
+
+def get_async_db():
+    """Return the process-wide async database handle"""
+    global _async_db
+    if _async_db is None:
+        _async_db = get_client().get_async_database_by_api_endpoint(os.getenv("ASTRAPY_API_ENDPOINT"), keyspace=ASTRAPY_KEYSPACE)
+    return _async_db
+
+def get_collection(name: str = COLLECTION_NAME):
+    """Return a reused sync collection object, so its connection pool is reused too"""
+    if name not in _collections:
+        _collections[name] = get_db().get_collection(name)
+    return _collections[name]
+
+def get_async_collection(name: str = COLLECTION_NAME):
+    """Return a reused async collection object for use on the event loop"""
+    if name not in _async_collections:
+        _async_collections[name] = get_async_db().get_collection(name)
+    return _async_collections[name]
+
+async def _warm_up():
+    try:
+        get_async_collection()
+        collections = await get_async_db().list_collection_names()
+        print(f"Available collections: {collections}")
+    except Exception as e:
+        # Requests that need the database will report the error themselves
+        print(f"❌ Could not reach Astra DB: {str(e)}")
+
+async def connect():
+    """Startup hook: create the handles and check reachability without delaying startup"""
+    global _warm_up_task
+    _warm_up_task = asyncio.create_task(_warm_up())
+
+async def close():
+    """Shutdown hook: close pooled connections and drop the handles"""
+    global _client, _db, _async_db, _warm_up_task
+    if _warm_up_task is not None:
+        _warm_up_task.cancel()
+        _warm_up_task = None
+    for collection in _async_collections.values():
+        await collection.__aexit__()
+    _async_collections.clear()
+    _collections.clear()
+    _client = _db = _async_db = None
 
 def print_collection_data():
-    instagram_collection = db.get_collection("instagram_data")
+    instagram_collection = get_collection()
     
     # Find all documents
     documents = instagram_collection.find({})